@@ -35,11 +35,12 @@ done
 echo "ok"
 
 echo -n "5) 等待 Web 应用..."
-until curl -sf "$WEB_URL/health" > /dev/null; do
+until curl -sf "$WEB_URL/readyz" > /dev/null; do
   echo -n "."
-  sleep 3
+  sleep 0.5
 done
 echo "ok"
+curl -s "$WEB_URL/readyz" | grep -o '"startup":{[^}]*}' || true
 
 echo -n "6) 等待 Kibana..."
 until curl -s "$KIBANA_URL/api/status" | grep -q "available"; do
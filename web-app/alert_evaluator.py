@@ -0,0 +1,791 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式告警评估器 - 替代每分钟执行一次的 Watcher 搜索
+
+功能:
+1. 直接读取 elasticsearch/watchers/*.json 中的 Watcher 定义作为告警规则
+2. 按事件增量维护滑动窗口计数器与每个接口的延迟分布（sketch）
+3. 每条事件 O(1)（均摊）更新并判断阈值条件，触发即告警，无需轮询
+4. 可运行在日志转发进程中（LOG_RING_ENABLED，整个主机一个窗口）、作为日志文件 tailer 运行，
+   或作为应用内 QueueHandler 的下游（仅单进程时与 Watcher 等价，多 worker 时各自统计）
+
+用法示例:
+    python alert_evaluator.py app.log
+    python alert_evaluator.py --follow /var/lib/docker/containers/<id>/<id>-json.log
+    docker logs -f elk-web-app 2>&1 | python alert_evaluator.py -
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timezone
+
+from log_query import extract_url_path, parse_duration, parse_line, to_severity
+
+# ============================================
+# 配置参数
+# ============================================
+
+# Watcher 定义目录（容器内可通过 WATCHER_DIR 环境变量指定挂载路径）
+WATCHER_DIR = os.environ.get(
+    "WATCHER_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "elasticsearch", "watchers"),
+)
+
+# 滑动窗口的时间槽粒度（秒）
+SLOT_SECONDS = 1
+
+# 延迟 sketch 的相对误差
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+# Elasticsearch 字段 -> 事件字段
+FIELD_MAP = {
+    "response_time_ms": "response_time_ms",
+    "severity": "severity",
+    "severity.keyword": "severity",
+    "status_code": "status_code",
+    "http_method": "http_method",
+    "url_path": "url_path",
+    "url_path_value": "url_path",
+    "url_path_value.keyword": "url_path",
+}
+
+# 比较运算符
+COMPARATORS = {
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+    "eq": lambda a, b: a == b,
+    "not_eq": lambda a, b: a != b,
+}
+
+# 告警输出使用独立的 logger，避免与 web_app 的日志回环
+alert_logger = logging.getLogger("elk_alerts")
+
+
+# ============================================
+# 延迟 sketch
+# ============================================
+
+class LatencySketch:
+    """
+    对数分桶的延迟分布（相对误差有界，可增可减）
+
+    每个值落入 ceil(log_gamma(v)) 号桶，分位数查询误差不超过
+    SKETCH_RELATIVE_ACCURACY；支持 remove 以便滑动窗口淘汰旧数据。
+    """
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = Counter()
+        self.count = 0
+
+    def key(self, value):
+        if value <= 0:
+            return None
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def add_key(self, key, n=1):
+        self.buckets[key] += n
+        self.count += n
+
+    def remove_key(self, key, n=1):
+        remaining = self.buckets[key] - n
+        if remaining > 0:
+            self.buckets[key] = remaining
+        else:
+            del self.buckets[key]
+        self.count -= n
+
+    def quantile(self, q):
+        """
+        参数:
+            q: 0-1 之间的分位
+
+        返回:
+            float | None
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets, key=lambda k: -math.inf if k is None else k):
+            seen += self.buckets[key]
+            if seen > rank:
+                if key is None:
+                    return 0.0
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return None
+
+
+# ============================================
+# 滑动窗口
+# ============================================
+
+class Slot:
+    """单个时间槽内的增量"""
+
+    __slots__ = ("count", "rt_sum", "rt_count", "rt_max", "rt_min",
+                 "terms", "term_rt", "term_rt_count", "sketch")
+
+    def __init__(self):
+        self.count = 0
+        self.rt_sum = 0.0
+        self.rt_count = 0
+        self.rt_max = None
+        self.rt_min = None
+        self.terms = defaultdict(Counter)          # 字段 -> 取值 -> 计数
+        self.term_rt = defaultdict(lambda: defaultdict(float))  # 字段 -> 取值 -> 响应时间和
+        self.term_rt_count = defaultdict(Counter)  # 字段 -> 取值 -> 带响应时间的计数
+        self.sketch = Counter()                    # (url_path, sketch key) -> 计数
+
+
+class SlidingWindow:
+    """
+    按时间槽维护的滑动窗口
+
+    每条事件只写入当前槽和运行总量；槽过期时从运行总量中减去，
+    因此每条事件恰好被加一次、减一次，均摊 O(1)。
+    max/min 无法相减，仅在需要时遍历槽计算。
+    """
+
+    def __init__(self, window_seconds, term_fields=(), slot_seconds=SLOT_SECONDS):
+        self.window_seconds = window_seconds
+        self.slot_seconds = slot_seconds
+        self.term_fields = tuple(term_fields)
+        self.slots = deque()                       # (槽编号, Slot)
+        self.count = 0
+        self.rt_sum = 0.0
+        self.rt_count = 0
+        self.terms = defaultdict(Counter)
+        self.term_rt = defaultdict(lambda: defaultdict(float))
+        self.term_rt_count = defaultdict(Counter)
+        self.sketches = defaultdict(LatencySketch)
+        self._keys = LatencySketch()               # 仅用于计算分桶编号
+
+    def _slot_index(self, ts):
+        return int(ts // self.slot_seconds)
+
+    def advance(self, ts):
+        """淘汰早于 ts - window 的槽"""
+        cutoff = self._slot_index(ts - self.window_seconds)
+        slots = self.slots
+        while slots and slots[0][0] <= cutoff:
+            _, slot = slots.popleft()
+            self.count -= slot.count
+            self.rt_sum -= slot.rt_sum
+            self.rt_count -= slot.rt_count
+            for field, counts in slot.terms.items():
+                totals = self.terms[field]
+                totals.subtract(counts)
+                for value in counts:
+                    if totals[value] <= 0:
+                        del totals[value]
+            for field, sums in slot.term_rt.items():
+                totals = self.term_rt[field]
+                counts = self.term_rt_count[field]
+                for value, rt in sums.items():
+                    n = slot.term_rt_count[field][value]
+                    if counts[value] <= n:
+                        del totals[value]
+                        del counts[value]
+                    else:
+                        totals[value] -= rt
+                        counts[value] -= n
+            for (path, key), n in slot.sketch.items():
+                sketch = self.sketches[path]
+                sketch.remove_key(key, n)
+                if not sketch.count:
+                    del self.sketches[path]
+
+    def _slot_for(self, ts):
+        index = self._slot_index(ts)
+        slots = self.slots
+        if not slots or slots[-1][0] < index:
+            slot = Slot()
+            slots.append((index, slot))
+            return slot
+        # 乱序事件：落入仍在窗口内的历史槽，过旧的直接丢弃
+        if index <= slots[-1][0] - self.window_seconds / self.slot_seconds:
+            return None
+        for position in range(len(slots) - 1, -1, -1):
+            slot_index, slot = slots[position]
+            if slot_index == index:
+                return slot
+            if slot_index < index:
+                slot = Slot()
+                slots.insert(position + 1, (index, slot))
+                return slot
+        slot = Slot()
+        slots.appendleft((index, slot))
+        return slot
+
+    def add(self, ts, event):
+        """
+        写入事件
+
+        参数:
+            ts: 事件时间（秒）
+            event: 事件字典
+        """
+        self.advance(ts)
+        slot = self._slot_for(ts)
+        if slot is None:
+            return
+
+        slot.count += 1
+        self.count += 1
+
+        rt = event.get("response_time_ms")
+        if rt is not None:
+            slot.rt_sum += rt
+            slot.rt_count += 1
+            self.rt_sum += rt
+            self.rt_count += 1
+            if slot.rt_max is None or rt > slot.rt_max:
+                slot.rt_max = rt
+            if slot.rt_min is None or rt < slot.rt_min:
+                slot.rt_min = rt
+            path = event.get("url_path") or ""
+            key = self._keys.key(rt)
+            slot.sketch[(path, key)] += 1
+            self.sketches[path].add_key(key)
+
+        for field in self.term_fields:
+            value = event.get(field)
+            if value is None:
+                continue
+            slot.terms[field][value] += 1
+            self.terms[field][value] += 1
+            if rt is not None:
+                slot.term_rt[field][value] += rt
+                slot.term_rt_count[field][value] += 1
+                self.term_rt[field][value] += rt
+                self.term_rt_count[field][value] += 1
+
+    # ---------- 窗口统计 ----------
+
+    def rt_max(self):
+        values = [slot.rt_max for _, slot in self.slots if slot.rt_max is not None]
+        return max(values) if values else None
+
+    def rt_min(self):
+        values = [slot.rt_min for _, slot in self.slots if slot.rt_min is not None]
+        return min(values) if values else None
+
+    def rt_avg(self):
+        return self.rt_sum / self.rt_count if self.rt_count else None
+
+    def quantile(self, q, path=None):
+        """窗口内响应时间分位数；path 为 None 时合并所有接口"""
+        if path is not None:
+            sketch = self.sketches.get(path)
+            return sketch.quantile(q) if sketch else None
+        merged = LatencySketch()
+        for sketch in self.sketches.values():
+            for key, n in sketch.buckets.items():
+                merged.add_key(key, n)
+        return merged.quantile(q)
+
+    def term_buckets(self, field, size=10, order=None):
+        """
+        生成与 Elasticsearch terms 聚合结构一致的桶
+
+        参数:
+            order: None 按 doc_count 降序；("avg_response_time", "desc") 按平均响应时间
+        """
+        counts = self.terms.get(field, {})
+        buckets = []
+        for value, n in counts.items():
+            rt_count = self.term_rt_count[field][value]
+            avg = self.term_rt[field][value] / rt_count if rt_count else None
+            buckets.append({"key": value, "doc_count": n, "avg_response_time": {"value": avg}})
+        if order:
+            _, direction = order
+            buckets.sort(key=lambda b: b["avg_response_time"]["value"] or 0,
+                         reverse=direction == "desc")
+        else:
+            buckets.sort(key=lambda b: b["doc_count"], reverse=True)
+        return buckets[:size]
+
+
+# ============================================
+# 告警规则（由 Watcher 定义转换）
+# ============================================
+
+def _field(name):
+    if name not in FIELD_MAP:
+        raise ValueError(f"不支持的字段: {name}")
+    return FIELD_MAP[name]
+
+
+def _range_predicate(field, bounds):
+    key = _field(field)
+    checks = [(COMPARATORS[op], value) for op, value in bounds.items() if op in COMPARATORS]
+
+    def predicate(event):
+        value = event.get(key)
+        if value is None:
+            return False
+        return all(compare(value, bound) for compare, bound in checks)
+    return predicate
+
+
+def _term_predicate(field, value):
+    key = _field(field)
+    if isinstance(value, dict):
+        value = value.get("value")
+    return lambda event: event.get(key) == value
+
+
+def _terms_predicate(field, values):
+    key = _field(field)
+    values = set(values)
+    return lambda event: event.get(key) in values
+
+
+def _clause_predicate(clause):
+    """将单个查询子句转换为事件断言；时间范围子句返回 None"""
+    (kind, body), = clause.items()
+    if kind == "range":
+        (field, bounds), = body.items()
+        if field == "@timestamp":
+            return None
+        return _range_predicate(field, bounds)
+    if kind == "term":
+        (field, value), = body.items()
+        return _term_predicate(field, value)
+    if kind == "terms":
+        (field, values), = body.items()
+        return _terms_predicate(field, values)
+    if kind == "bool":
+        return _bool_predicate(body)
+    if kind == "match_all":
+        return lambda event: True
+    raise ValueError(f"不支持的查询子句: {kind}")
+
+
+def _bool_predicate(body):
+    must = [p for p in (_clause_predicate(c) for c in body.get("must", []) + body.get("filter", [])) if p]
+    must_not = [p for p in (_clause_predicate(c) for c in body.get("must_not", [])) if p]
+    should = [p for p in (_clause_predicate(c) for c in body.get("should", [])) if p]
+    minimum = body.get("minimum_should_match", 1 if should and not must else 0)
+
+    def predicate(event):
+        if not all(p(event) for p in must):
+            return False
+        if any(p(event) for p in must_not):
+            return False
+        if minimum and sum(1 for p in should if p(event)) < minimum:
+            return False
+        return True
+    return predicate
+
+
+def _find_window(query):
+    """在查询中查找 @timestamp 的 now-Xm 下限，返回窗口秒数"""
+    if isinstance(query, dict):
+        for key, value in query.items():
+            if key == "@timestamp" and isinstance(value, dict):
+                bound = value.get("gte") or value.get("gt") or ""
+                if bound.startswith("now-"):
+                    return parse_duration(bound[4:])
+            found = _find_window(value)
+            if found:
+                return found
+    elif isinstance(query, list):
+        for item in query:
+            found = _find_window(item)
+            if found:
+                return found
+    return None
+
+
+class AlertRule:
+    """
+    由一个 Watcher 定义生成的告警规则
+
+    支持的 Watcher 子集:
+        input.search.request.body.query: bool / range / term / terms
+        aggs: value_count / avg / max / min / sum / percentiles / terms（可带 avg 子聚合）
+        condition.compare: ctx.payload.aggregations.<name>.value
+        actions: logging.text 与 index.body 中的 {{...}} 模板
+    """
+
+    def __init__(self, name, definition):
+        self.name = name
+        self.definition = definition
+        body = definition["input"]["search"]["request"]["body"]
+        query = body.get("query", {"match_all": {}})
+
+        self.window_seconds = _find_window(query) or 300
+        self.throttle_seconds = parse_duration(
+            definition.get("throttle_period")
+            or definition.get("trigger", {}).get("schedule", {}).get("interval", "1m")
+        )
+        self.matches = _clause_predicate(query) or (lambda event: True)
+        self.aggs = body.get("aggs", {})
+
+        for spec in self.aggs.values():
+            for kind, params in spec.items():
+                if kind != "aggs":
+                    self._metric_field(kind, params)
+            for sub in spec.get("aggs", {}).values():
+                (kind, params), = sub.items()
+                if kind != "avg":
+                    raise ValueError(f"terms 子聚合仅支持 avg: {kind}")
+                self._metric_field(kind, params)
+        term_fields = [_field(spec["terms"]["field"]) for spec in self.aggs.values() if "terms" in spec]
+        self.window = SlidingWindow(self.window_seconds, term_fields)
+
+        (self.condition_path, comparison), = definition["condition"]["compare"].items()
+        (op, self.condition_value), = comparison.items()
+        self.compare = COMPARATORS[op]
+        self.condition_agg = self.condition_path.split(".")[3]
+
+        self.actions = definition.get("actions", {})
+        self.active = False
+        self.last_fired = None
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            definition = json.load(f)
+        name = os.path.splitext(os.path.basename(path))[0]
+        return cls(name, definition)
+
+    @staticmethod
+    def _metric_field(kind, params):
+        """
+        校验数值聚合的字段
+
+        滑动窗口只累计 response_time_ms，avg/max/min/sum/percentiles
+        作用在其他字段上时无法计算，直接报错而不是静默返回响应时间的统计
+        """
+        if kind in ("avg", "max", "min", "sum", "percentiles"):
+            field = _field(params.get("field", ""))
+            if field != "response_time_ms":
+                raise ValueError(f"聚合 {kind} 仅支持 response_time_ms 字段: {params.get('field')}")
+
+    def _metric(self, spec):
+        (kind, params), = ((k, v) for k, v in spec.items() if k != "aggs")
+        self._metric_field(kind, params)
+        window = self.window
+        if kind == "value_count":
+            return {"value": window.count}
+        if kind == "avg":
+            return {"value": window.rt_avg()}
+        if kind == "max":
+            return {"value": window.rt_max()}
+        if kind == "min":
+            return {"value": window.rt_min()}
+        if kind == "sum":
+            return {"value": window.rt_sum}
+        if kind == "percentiles":
+            percents = params.get("percents", [1, 5, 25, 50, 75, 95, 99])
+            return {"values": {str(float(p)): window.quantile(p / 100.0) for p in percents}}
+        if kind == "terms":
+            order = None
+            if "order" in params:
+                (order_key, direction), = params["order"].items()
+                order = (order_key, direction)
+            buckets = window.term_buckets(_field(params["field"]), params.get("size", 10), order)
+            if "aggs" not in spec:
+                for bucket in buckets:
+                    del bucket["avg_response_time"]
+            return {"buckets": buckets}
+        raise ValueError(f"不支持的聚合: {kind}")
+
+    def condition_met(self):
+        """当前窗口是否满足告警条件（value_count 条件为 O(1)）"""
+        spec = self.aggs[self.condition_agg]
+        if "value_count" in spec:
+            value = self.window.count
+        else:
+            value = self._metric(spec)["value"]
+        return value is not None and self.compare(value, self.condition_value)
+
+    def payload(self):
+        return {"aggregations": {name: self._metric(spec) for name, spec in self.aggs.items()}}
+
+    def add(self, ts, event):
+        """
+        写入事件并判断是否触发
+
+        返回:
+            dict | None: 触发时返回告警上下文
+        """
+        if not self.matches(event):
+            return None
+        self.window.add(ts, event)
+        if not self.condition_met():
+            self.active = False
+            return None
+        if self.active and ts - self.last_fired < self.throttle_seconds:
+            return None
+        self.active = True
+        self.last_fired = ts
+        return {
+            "watch_id": self.name,
+            "execution_time": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+            "payload": self.payload(),
+            "metadata": self.definition.get("metadata", {}),
+        }
+
+    def expire(self, ts):
+        """时间推进时淘汰过期数据，条件不再满足则复位"""
+        self.window.advance(ts)
+        if self.active and not self.condition_met():
+            self.active = False
+
+
+# ============================================
+# 模板渲染
+# ============================================
+
+TEMPLATE_PATTERN = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+
+
+def _resolve(ctx, path):
+    parts = path.split(".")
+    if parts[0] == "ctx":
+        parts = parts[1:]
+    value = ctx
+    for part in parts:
+        if isinstance(value, dict):
+            value = value.get(part)
+        else:
+            return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return "" if value is None else str(value)
+
+
+def render(template, ctx):
+    """渲染 Watcher 动作中的 {{ctx...}} 模板"""
+    if isinstance(template, str):
+        return TEMPLATE_PATTERN.sub(lambda m: _resolve(ctx, m.group(1)), template)
+    if isinstance(template, dict):
+        return {key: render(value, ctx) for key, value in template.items()}
+    if isinstance(template, list):
+        return [render(value, ctx) for value in template]
+    return template
+
+
+# ============================================
+# 评估器
+# ============================================
+
+class AlertEvaluator:
+    """
+    流式告警评估器
+
+    参数:
+        rules: AlertRule 列表
+        on_alert: 回调，参数为渲染后的告警文档（对应 Watcher 的 index 动作）
+    """
+
+    def __init__(self, rules, on_alert=None):
+        self.rules = list(rules)
+        self.on_alert = on_alert
+        self.latest_ts = None
+
+    @classmethod
+    def from_watchers(cls, directory=WATCHER_DIR, on_alert=None):
+        paths = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory) if name.endswith(".json")
+        )
+        return cls((AlertRule.load(path) for path in paths), on_alert)
+
+    def process(self, event):
+        """
+        处理一条事件
+
+        参数:
+            event: 含 ts（毫秒）及 url_path/status_code/response_time_ms/severity 的字典
+
+        返回:
+            list[dict]: 本次触发的告警文档
+        """
+        ts = event["ts"] / 1000.0
+        if self.latest_ts is None or ts > self.latest_ts:
+            self.latest_ts = ts
+        fired = []
+        for rule in self.rules:
+            ctx = rule.add(ts, event)
+            if ctx is not None:
+                fired.append(self._fire(rule, ctx))
+        return fired
+
+    def tick(self, now=None):
+        """无事件时推进时间（由 follow 在空闲时调用），使已恢复的规则复位"""
+        now = now if now is not None else time.time()
+        for rule in self.rules:
+            rule.expire(now)
+
+    def _fire(self, rule, ctx):
+        document = {"alert_type": rule.name, "timestamp": ctx["execution_time"]}
+        for action in rule.actions.values():
+            if "logging" in action:
+                alert_logger.info(render(action["logging"]["text"], ctx))
+            if "index" in action:
+                document = render(action["index"].get("body", document), ctx)
+        if self.on_alert is not None:
+            self.on_alert(document)
+        return document
+
+
+# ============================================
+# 应用内接入（QueueHandler 下游）
+# ============================================
+
+class AlertHandler(logging.Handler):
+    """
+    将 web_app 的日志记录送入评估器
+
+    配合 QueueHandler/QueueListener 使用，评估在监听线程中进行，
+    不阻塞请求处理；没有 http_method 的非请求记录（启动耗时、应用内告警警告等）被忽略。只能看到本进程的日志，多个 Gunicorn worker 时
+    每个 worker 的窗口只包含部分请求，应改用转发进程或 tailer 统一评估。
+    """
+
+    def __init__(self, evaluator):
+        super().__init__()
+        self.evaluator = evaluator
+
+    def emit(self, record):
+        # 只评估请求日志；启动耗时等非请求记录没有 http_method，不计入窗口
+        if not getattr(record, "http_method", None):
+            return
+        try:
+            status_code = getattr(record, "status_code", None)
+            self.evaluator.process({
+                "ts": int(record.created * 1000),
+                "url_path": extract_url_path(getattr(record, "url", "")),
+                "status_code": status_code,
+                "response_time_ms": getattr(record, "response_time_ms", None),
+                "http_method": getattr(record, "http_method", ""),
+                "severity": to_severity(record.levelname, status_code),
+            })
+        except Exception:
+            self.handleError(record)
+
+
+# ============================================
+# 命令行（日志 tailer）
+# ============================================
+
+def _rotated(path, f):
+    """
+    判断被跟踪的文件是否已轮转或被截断
+
+    返回:
+        str | None: "rotated"（路径指向新文件）、"truncated"（文件变短）或 None
+    """
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return None  # 轮转中，新文件尚未创建
+    opened = os.fstat(f.fileno())
+    if (current.st_ino, current.st_dev) != (opened.st_ino, opened.st_dev):
+        return "rotated"
+    if current.st_size < f.tell():
+        return "truncated"
+    return None
+
+
+def follow(path, poll_interval=0.2, on_idle=None, idle_interval=1.0):
+    """
+    类似 tail -F 持续读取文件新增内容
+
+    Docker json-file 按 max-size 轮转时会把当前文件改名并新建同名文件，
+    读到末尾后比较路径与已打开文件的 inode，发生变化则从头读取新文件；
+    文件被截断时回到开头。
+
+    参数:
+        path: 文件路径
+        poll_interval: 无新数据时的轮询间隔（秒）
+        on_idle: 无新数据时的回调（例如 AlertEvaluator.tick），参数为当前时间
+        idle_interval: on_idle 的最小调用间隔（秒）
+    """
+    f = open(path, "rb")
+    f.seek(0, os.SEEK_END)
+    buffer = b""
+    last_idle = 0.0
+    try:
+        while True:
+            chunk = f.readline()
+            if chunk:
+                buffer += chunk
+                if buffer.endswith(b"\n"):
+                    yield buffer
+                    buffer = b""
+                continue
+            state = _rotated(path, f)
+            if state == "rotated":
+                f.close()
+                f = open(path, "rb")
+                buffer = b""
+                continue
+            if state == "truncated":
+                f.seek(0)
+                buffer = b""
+                continue
+            now = time.time()
+            if on_idle is not None and now - last_idle >= idle_interval:
+                on_idle(now)
+                last_idle = now
+            time.sleep(poll_interval)
+    finally:
+        f.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="流式告警评估器")
+    parser.add_argument("source", help="日志文件，- 表示标准输入")
+    parser.add_argument("--watchers", default=WATCHER_DIR, help="Watcher 定义目录")
+    parser.add_argument("--follow", action="store_true", help="持续跟踪文件新增内容")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s", stream=sys.stderr)
+
+    def print_alert(document):
+        print(json.dumps(document, ensure_ascii=False), flush=True)
+
+    evaluator = AlertEvaluator.from_watchers(args.watchers, on_alert=print_alert)
+    for rule in evaluator.rules:
+        alert_logger.info(f"加载规则 {rule.name}: 窗口 {rule.window_seconds:g}s，"
+                          f"条件 {rule.condition_agg} {rule.condition_value}")
+
+    if args.source == "-":
+        lines = sys.stdin.buffer
+    elif args.follow:
+        lines = follow(args.source, on_idle=evaluator.tick)
+    else:
+        lines = open(args.source, "rb")
+
+    processed = 0
+    started = time.perf_counter()
+    for line in lines:
+        event = parse_line(line)
+        if event is not None:
+            evaluator.process(event)
+            processed += 1
+    elapsed = time.perf_counter() - started
+    alert_logger.info(f"处理 {processed} 条事件，用时 {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
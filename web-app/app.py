@@ -4,18 +4,109 @@
 Web 应用 - 用于生成日志供 ELK Stack 采集
 """
 
-from flask import Flask, request, jsonify, g
+import time
+
+# 记录模块导入起点，用于统计启动耗时
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
 import logging
+import hashlib
 import json
-import time
 import random
 from datetime import datetime
 import traceback
+import os
 import sys
+import threading
 import uuid
 
+import log_ring
+import profiler
+
+
+# ============================================
+# 请求计时
+# ============================================
+# 所有耗时基于 time.perf_counter_ns（单调、纳秒精度）：请求起点在 before_request，
+# 终点在 after_request（此时序列化与错误处理器均已完成），
+# 是请求日志中 response_time_ms 的唯一来源
+def _add_phase(name, elapsed_ns):
+    """累加当前请求某个阶段的耗时（纳秒）"""
+    if not has_request_context():
+        return
+    phases = g.get("phases")
+    if phases is not None:
+        phases[name] = phases.get(name, 0) + elapsed_ns
+
+
+def _elapsed_ns():
+    """当前请求从 before_request 起经过的时间（纳秒）"""
+    return time.perf_counter_ns() - g.request_started_ns
+
+
+def _ns_to_ms(elapsed_ns):
+    return round(elapsed_ns / 1_000_000, 2)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify 的序列化耗时计入 serialization 阶段"""
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter_ns()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            _add_phase("serialization", time.perf_counter_ns() - started)
+
+
+class InstrumentedFlask(Flask):
+    """视图函数与错误处理器的执行耗时计入 handler 阶段"""
+
+    json_provider_class = TimedJSONProvider
+
+    def dispatch_request(self):
+        started = time.perf_counter_ns()
+        try:
+            return super().dispatch_request()
+        finally:
+            _add_phase("handler", time.perf_counter_ns() - started)
+
+    def handle_user_exception(self, e):
+        started = time.perf_counter_ns()
+        try:
+            return super().handle_user_exception(e)
+        finally:
+            _add_phase("handler", time.perf_counter_ns() - started)
+
+    def handle_exception(self, e):
+        # 未处理异常时 Flask 在 handle_exception 内部调用 finalize_request
+        # （after_request 在其中写出请求日志），错误处理器的耗时须在 finalize_request
+        # 开始时结算；finally 只兜底处理没有进入 finalize_request 的情况（异常继续抛出）
+        g.exception_started_ns = time.perf_counter_ns()
+        try:
+            return super().handle_exception(e)
+        finally:
+            self._close_exception_phase()
+
+    def finalize_request(self, rv, from_error_handler=False):
+        if from_error_handler:
+            self._close_exception_phase()
+        return super().finalize_request(rv, from_error_handler)
+
+    @staticmethod
+    def _close_exception_phase():
+        """将 handle_exception 开始至今的耗时计入 handler 阶段（只结算一次）"""
+        if not has_request_context():
+            return
+        started = g.pop("exception_started_ns", None)
+        if started is not None:
+            _add_phase("handler", time.perf_counter_ns() - started)
+
+
 # 创建 Flask 应用
-app = Flask(__name__)
+app = InstrumentedFlask(__name__)
 
 # ============================================
 # 日志配置 - 输出到 stdout，JSON 格式
@@ -28,7 +119,7 @@ class JsonFormatter(logging.Formatter):
     def format(self, record):
         # 构建基础日志字典
         log_data = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -47,10 +138,21 @@ class JsonFormatter(logging.Formatter):
                 "ip": record.ip,
                 "user_agent": record.user_agent
             })
+            # 服务端总耗时中视图/错误处理器本身的耗时
+            if hasattr(record, 'handler_time_ms'):
+                log_data["handler_time_ms"] = record.handler_time_ms
+            # 统一访问日志模式下补充原 Gunicorn 访问日志中的字段
+            for field in ACCESS_LOG_FIELDS:
+                if hasattr(record, field):
+                    log_data[field] = getattr(record, field)
 
         # 关联追踪 ID（用于跨日志关联）
         if hasattr(record, 'trace_id'):
             log_data["trace_id"] = record.trace_id
+
+        # 请求剖析摘要（分阶段耗时与栈采样结果）
+        if hasattr(record, 'profile'):
+            log_data["profile"] = record.profile
         
         # 如果有异常信息，添加堆栈跟踪
         if record.exc_info:
@@ -63,22 +165,116 @@ class JsonFormatter(logging.Formatter):
         return json.dumps(log_data, ensure_ascii=False)
 
 
-# 配置根日志记录器
+# 统一访问日志：每个请求只输出一条 JSON 记录（包含原 Gunicorn 访问日志的字段），
+# 同时在 gunicorn.conf.py 中关闭 Gunicorn 访问日志
+UNIFIED_ACCESS_LOG = os.environ.get("UNIFIED_ACCESS_LOG", "false").lower() in ("1", "true", "yes")
+
+# 统一访问日志模式下请求日志额外包含的字段
+ACCESS_LOG_FIELDS = ("response_bytes", "http_version", "referrer")
+
+# 应用日志记录器（处理器在 init_logging 中延迟创建）
 logger = logging.getLogger('web_app')
-logger.setLevel(logging.DEBUG)
 
-# 创建控制台处理器，输出到 stdout
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(JsonFormatter())
+# 日志管道状态
+_logging_state = {"ready": False, "console_handler": None, "alert_listener": None}
+_logging_lock = threading.Lock()
 
-# 添加处理器到日志记录器
-logger.addHandler(console_handler)
+# 启动耗时（毫秒），通过 /readyz 和启动日志输出
+# import_ms: 模块导入耗时（preload_app 时为 master 的导入耗时）；
+# ready_ms: 本进程起点（Gunicorn worker 为 fork 完成时，否则为导入开始）到日志管道就绪；
+# first_request_ms: 首个业务请求的处理耗时
+startup_timings = {"import_ms": None, "logging_init_ms": None, "ready_ms": None, "first_request_ms": None}
 
 # 请求计数器（用于模拟业务数据）
 request_counter = {"count": 0}
 
 
+def init_logging(process_started=None):
+    """
+    初始化日志管道
+
+    在 Gunicorn worker fork 之后调用（见 gunicorn.conf.py 的 post_fork），
+    后台线程（告警评估监听线程）不会在 master 进程中创建；
+    直接运行或未经 post_fork 时，在第一个业务请求或 /readyz 前自动调用。
+
+    参数:
+        process_started: 本进程起点（time.perf_counter()），post_fork 中传入 fork 完成的时刻，
+                         默认为模块导入开始；preload_app 时 worker 不能沿用 master 的导入时刻
+    """
+    if _logging_state["ready"]:
+        return
+    with _logging_lock:
+        if _logging_state["ready"]:
+            return
+        started = time.perf_counter()
+
+        logger.setLevel(logging.DEBUG)
+
+        # 创建控制台处理器，输出到 stdout；
+        # 启用共享内存环形缓冲区且已绑定槽位时写入缓冲区，由转发进程统一输出
+        ring = log_ring.current()
+        if ring is not None:
+            console_handler = log_ring.RingBufferHandler(ring)
+        else:
+            console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(logging.DEBUG)
+        console_handler.setFormatter(JsonFormatter())
+
+        # 添加处理器到日志记录器
+        logger.addHandler(console_handler)
+        _logging_state["console_handler"] = console_handler
+
+        # 流式告警评估（可选）
+        # 通过 QueueHandler 将日志记录送入后台线程中的评估器，按 Watcher 定义增量判断告警，
+        # 告警以 JSON 日志输出到 stdout（logger 为 elk_alerts）。
+        # 启用环形缓冲区时评估器运行在转发进程中，统计所有 worker 的日志，这里不再重复创建；
+        # 否则每个进程只能看到自己处理的请求，多 worker 时窗口计数被按 worker 拆分，
+        # 与 Watcher 的全量统计不等价（阈值相当于放大 worker 数倍）
+        if ring is None and os.environ.get("ALERT_EVALUATOR_ENABLED", "false").lower() in ("1", "true", "yes"):
+            import queue
+            from logging.handlers import QueueHandler, QueueListener
+            from alert_evaluator import AlertEvaluator, AlertHandler, alert_logger
+
+            alert_logger.setLevel(logging.INFO)
+            alert_logger.addHandler(console_handler)
+            # 警告在接入评估器之前输出，避免自身被计入错误率窗口
+            if "gunicorn" in sys.modules:
+                logger.warning("应用内告警评估按 worker 各自统计，与 Watcher 不等价；"
+                               "请开启 LOG_RING_ENABLED 由转发进程统一评估，或使用 alert_evaluator.py --follow")
+            alert_queue = queue.SimpleQueue()
+            alert_listener = QueueListener(alert_queue, AlertHandler(AlertEvaluator.from_watchers()))
+            alert_listener.start()
+            logger.addHandler(QueueHandler(alert_queue))
+            _logging_state["alert_listener"] = alert_listener
+
+        finished = time.perf_counter()
+        startup_timings["logging_init_ms"] = round((finished - started) * 1000, 2)
+        if process_started is None:
+            process_started = _IMPORT_STARTED
+        startup_timings["ready_ms"] = round((finished - process_started) * 1000, 2)
+        _logging_state["ready"] = True
+
+
+def logging_checks():
+    """
+    检查日志管道是否可用
+
+    返回:
+        dict: 检查项 -> 是否通过
+    """
+    checks = {"logging_initialized": _logging_state["ready"]}
+    handler = _logging_state["console_handler"]
+    if isinstance(handler, log_ring.RingBufferHandler):
+        checks["log_shipper_alive"] = log_ring.shipper_alive()
+    elif handler is not None:
+        stream = handler.stream
+        checks["stdout_writable"] = not getattr(stream, "closed", False)
+    listener = _logging_state["alert_listener"]
+    if listener is not None:
+        checks["alert_listener_alive"] = listener._thread is not None and listener._thread.is_alive()
+    return checks
+
+
 # ============================================
 # 辅助函数
 # ============================================
@@ -89,14 +285,28 @@ def _get_trace_id():
     return g.trace_id
 
 
-def log_request(status_code, response_time, extra_msg=""):
+def log_request(status_code, extra_msg="", exc_info=None):
     """
     记录 HTTP 请求日志
-    
+
+    日志在 after_request 中统一写出，响应时间取自请求计时，
+    覆盖序列化和错误处理器；同一请求多次调用时以最后一次为准
+
     参数:
         status_code: HTTP 状态码
-        response_time: 响应时间（毫秒）
         extra_msg: 额外的消息
+        exc_info: 异常信息（sys.exc_info()），会输出完整堆栈
+    """
+    log_level, message = request_log_message(status_code, extra_msg)
+    _defer_request_log(log_level, message, status_code, exc_info)
+
+
+def request_log_message(status_code, extra_msg=""):
+    """
+    根据状态码确定请求日志的级别和消息
+
+    返回:
+        tuple: (日志级别, 消息)
     """
     log_level = logging.INFO
     message = f"HTTP Request Processed"
@@ -108,41 +318,269 @@ def log_request(status_code, response_time, extra_msg=""):
     elif status_code >= 400:
         log_level = logging.WARNING
         message = f"Client Error: {extra_msg}" if extra_msg else "Client Error"
+    elif status_code == 304:
+        # 条件请求命中缓存（If-None-Match），不是重定向
+        message = f"Not Modified: {extra_msg}" if extra_msg else "Not Modified"
     elif status_code >= 300:
         log_level = logging.INFO
         message = f"Redirect: {extra_msg}" if extra_msg else "Redirect"
     else:
         message = f"Success: {extra_msg}" if extra_msg else "Success"
     
-    # 创建日志记录，附加 HTTP 信息
-    logger.log(
-        log_level,
-        message,
-        extra={
-            'trace_id': _get_trace_id(),
-            'http_method': request.method,
-            'url': request.url,
-            'status_code': status_code,
-            'response_time_ms': round(response_time * 1000, 2),
-            'ip': request.remote_addr,
-            'user_agent': request.headers.get('User-Agent', 'Unknown')
-        }
-    )
+    return log_level, message
+
+
+def _defer_request_log(log_level, message, status_code, exc_info=None):
+    """暂存请求日志，由 emit_request_log 在请求结束时写出"""
+    g.request_log = (log_level, message, status_code, exc_info)
 
 
 # ============================================
-# 路由定义
+# 请求钩子
 # ============================================
 
-@app.route('/')
-def index():
+# 探针接口不记录日志；/readyz 自行初始化日志管道，不依赖业务请求
+PROBE_PATHS = ("/livez", "/readyz")
+
+
+@app.before_request
+def start_request_timer():
+    """请求计时起点（最先注册，最先执行）"""
+    g.request_started_ns = time.perf_counter_ns()
+    g.phases = {}
+
+
+@app.before_request
+def ensure_logging():
+    """未经 post_fork 初始化时，在第一个业务请求前初始化日志管道"""
+    if not _logging_state["ready"] and request.path not in PROBE_PATHS:
+        init_logging()
+
+
+@app.after_request
+def record_first_request(response):
+    """记录首个业务请求的处理耗时，并输出一次启动耗时日志"""
+    if startup_timings["first_request_ms"] is None and request.path not in PROBE_PATHS:
+        startup_timings["first_request_ms"] = _ns_to_ms(_elapsed_ns())
+        logger.info(
+            f"Startup timings: import={startup_timings['import_ms']}ms, "
+            f"logging_init={startup_timings['logging_init_ms']}ms, "
+            f"ready={startup_timings['ready_ms']}ms, "
+            f"first_request={startup_timings['first_request_ms']}ms"
+        )
+    return response
+
+
+@app.before_request
+def start_profiling():
+    """开启剖析时，为业务请求登记栈采样并初始化分阶段计时"""
+    if not profiler.PROFILING_ENABLED or request.path in PROBE_PATHS:
+        return
+    g.profile = profiler.sampler.track(threading.get_ident())
+
+
+def finish_profiling(total_ns):
     """
-    首页路由
-    返回应用信息和可用接口列表
+    结束当前请求的栈采样并生成剖析摘要（由 emit_request_log 调用）
+
+    摘要将请求日志中的 handler_time_ms 拆分为 view_ms（视图/错误处理器本身）与
+    serialization_ms（JSON 序列化），随请求日志一起输出（profile 字段）；
+    超过阈值或被抽中的请求附带栈采样摘要，并将完整采样写入 PROFILE_DIR
+
+    返回:
+        dict | None: 未开启剖析时返回 None
     """
-    start_time = time.time()
-    
+    profile = g.pop("profile", None)
+    if profile is None:
+        return None
+    profiler.sampler.untrack(threading.get_ident())
+    total_ms = _ns_to_ms(total_ns)
+
+    # 序列化发生在视图/错误处理器内部：view_ms + serialization_ms = handler_time_ms
+    phases = g.phases
+    serialization = phases.get("serialization", 0)
+    summary = {
+        "endpoint": request.path,
+        "total_ms": total_ms,
+        "phases": {
+            "view_ms": _ns_to_ms(max(phases.get("handler", 0) - serialization, 0)),
+            "serialization_ms": _ns_to_ms(serialization),
+        },
+    }
+
+    if profile.samples and profiler.should_keep(total_ms):
+        summary["profile"] = profile.summary()
+        path = profiler.write_profile(profile, _get_trace_id())
+        summary["profile"]["file"] = os.path.basename(path)
+    return summary
+
+
+@app.after_request
+def emit_request_log(response):
+    """
+    写出 log_request 暂存的请求日志（最后注册，最先执行）
+
+    response_time_ms 为服务端总耗时（before_request 至此，含序列化与错误处理器），
+    handler_time_ms 为其中视图/错误处理器本身的耗时。
+
+    统一访问日志模式下，记录中追加 response_bytes / http_version / referrer，
+    未调用 log_request 的业务请求（如 405）也按响应状态码写出一条。
+    开启剖析时，剖析摘要作为 profile 字段附加在这条请求日志上
+    """
+    server_ns = _elapsed_ns()
+    profile_summary = finish_profiling(server_ns)
+    pending = g.pop("request_log", None)
+    if pending is None:
+        if not UNIFIED_ACCESS_LOG or request.path in PROBE_PATHS:
+            return response
+        log_level, message = request_log_message(response.status_code)
+        pending = (log_level, message, response.status_code, None)
+    log_level, message, status_code, exc_info = pending
+
+    extra = {
+        'trace_id': _get_trace_id(),
+        'http_method': request.method,
+        'url': request.url,
+        'status_code': status_code,
+        'response_time_ms': _ns_to_ms(server_ns),
+        'handler_time_ms': _ns_to_ms(g.phases.get("handler", 0)),
+        'ip': request.remote_addr,
+        'user_agent': request.headers.get('User-Agent', 'Unknown')
+    }
+    if UNIFIED_ACCESS_LOG:
+        extra.update({
+            'response_bytes': response.calculate_content_length() or 0,
+            'http_version': request.environ.get("SERVER_PROTOCOL", "HTTP/1.1").partition("/")[2],
+            'referrer': request.referrer or "-",
+        })
+    if profile_summary is not None:
+        extra['profile'] = profile_summary
+    logger.log(log_level, message, exc_info=exc_info, extra=extra)
+    return response
+
+
+# ============================================
+# 探针接口
+# ============================================
+
+@app.route('/livez')
+def livez():
+    """
+    存活探针
+    只要进程能处理请求即返回 200，不做任何检查、不记录日志
+    """
+    return "ok", 200, {"Content-Type": "text/plain"}
+
+
+@app.route('/readyz')
+def readyz():
+    """
+    就绪探针
+    日志管道初始化完成且可写（启用日志环形缓冲区时为转发进程存活）时返回 200，否则返回 503；
+    启用环形缓冲区时附带本 worker 缓冲区的占用与丢弃指标。
+    未经 post_fork 初始化时（如 gunicorn app:app、flask run）在此初始化日志管道
+    """
+    init_logging()
+    checks = logging_checks()
+    ready = all(checks.values())
     response = {
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "startup": startup_timings,
+    }
+    ring_metrics = log_ring.ring_metrics()
+    if ring_metrics is not None:
+        response["log_ring"] = ring_metrics
+    return jsonify(response), 200 if ready else 503
+
+
+# ============================================
+# 预渲染响应
+# ============================================
+
+# 首页与健康检查使用预渲染响应（默认关闭，使用 jsonify）：
+# 完整请求的吞吐量没有提升，开启后的收益只在于 If-None-Match 命中时返回 304 节省带宽
+PRERENDERED_RESPONSES = os.environ.get("PRERENDERED_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+
+# 动态字段的编码器（与 jsonify 一致，非 ASCII 字符转义）
+_encode_value = json.JSONEncoder(ensure_ascii=True).encode
+
+
+class PrerenderedJSON:
+    """
+    预渲染的 JSON 响应
+
+    启动时按 jsonify 的规则（键排序、紧凑分隔符、末尾换行）将静态部分序列化一次，
+    在动态字段处切分为字节片段；每次请求只序列化动态字段（计数器、时间戳）再拼接，
+    输出与 jsonify 逐字节一致。
+
+    弱 ETag 由静态部分计算：动态字段不改变响应的语义，客户端携带匹配的
+    If-None-Match 时直接返回 304，不生成响应体。
+    """
+
+    def __init__(self, payload, dynamic_fields):
+        """
+        参数:
+            payload: 静态字段
+            dynamic_fields: 每次请求填入的顶层字段名
+        """
+        self.payload = payload
+        markers = {name: f"\x00{name}\x00" for name in dynamic_fields}
+        template = app.json.dumps(dict(payload, **markers), separators=(",", ":")) + "\n"
+
+        # 按占位符在模板中的位置切分：[静态字节, 字段名, 静态字节, 字段名, ..., 静态字节]
+        positions = sorted((template.index(json.dumps(marker)), name) for name, marker in markers.items())
+        self.static_parts = []
+        self.fields = []
+        cursor = 0
+        for index, name in positions:
+            self.static_parts.append(template[cursor:index].encode("utf-8"))
+            self.fields.append(name)
+            cursor = index + len(json.dumps(markers[name]))
+        self.static_parts.append(template[cursor:].encode("utf-8"))
+
+        self.etag = hashlib.sha1(b"".join(self.static_parts)).hexdigest()[:16]
+        self.etag_header = f'W/"{self.etag}"'
+
+    def render(self, **values):
+        """
+        拼接静态片段与动态字段，返回响应体字节
+
+        拼接只有几微秒，不单独计时（计入 view 阶段），避免在热路径上增加计时开销
+        """
+        parts = self.static_parts
+        chunks = [parts[0]]
+        for i, name in enumerate(self.fields):
+            value = values[name]
+            chunks.append((str(value) if type(value) is int else _encode_value(value)).encode("utf-8"))
+            chunks.append(parts[i + 1])
+        return b"".join(chunks)
+
+    def response(self, status=200, **values):
+        """
+        生成响应；If-None-Match 与弱 ETag 匹配时返回 304
+
+        参数:
+            status: 状态码
+            values: 动态字段的值
+        """
+        if not PRERENDERED_RESPONSES:
+            response = jsonify(dict(self.payload, **values))
+            response.status_code = status
+            return response
+        # 只有携带 If-None-Match 时才解析该请求头
+        if "HTTP_IF_NONE_MATCH" in request.environ and request.if_none_match.contains_weak(self.etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(self.render(**values), status=status, content_type="application/json")
+        response.headers["ETag"] = self.etag_header
+        return response
+
+
+# 首页：接口目录不变，只有 total_requests 随请求变化
+INDEX_RESPONSE = PrerenderedJSON(
+    {
         "service": "ELK Web Application",
         "version": "1.0.0",
         "description": "日志生成应用 - 云计算课程项目",
@@ -156,14 +594,31 @@ def index():
             "error_500": "/error/500",
             "error_timeout": "/error/timeout"
         },
-        "total_requests": request_counter["count"]
-    }
-    
+    },
+    dynamic_fields=("total_requests",),
+)
+
+# 健康检查：状态固定，时间字段随请求变化
+HEALTH_RESPONSE = PrerenderedJSON({"status": "healthy"}, dynamic_fields=("timestamp", "uptime_seconds"))
+
+
+# ============================================
+# 路由定义
+# ============================================
+
+@app.route('/')
+def index():
+    """
+    首页路由
+    返回应用信息和可用接口列表
+    """
+    total_requests = request_counter["count"]
     request_counter["count"] += 1
-    response_time = time.time() - start_time
-    log_request(200, response_time, "Homepage accessed")
     
-    return jsonify(response), 200
+    response = INDEX_RESPONSE.response(total_requests=total_requests)
+    log_request(response.status_code, "Homepage accessed")
+    
+    return response
 
 
 @app.route('/health')
@@ -172,19 +627,15 @@ def health_check():
     健康检查接口
     用于监控服务状态
     """
-    start_time = time.time()
-    
-    response = {
-        "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
-        "uptime_seconds": time.time()
-    }
-    
     request_counter["count"] += 1
-    response_time = time.time() - start_time
-    log_request(200, response_time, "Health check")
     
-    return jsonify(response), 200
+    response = HEALTH_RESPONSE.response(
+        timestamp=datetime.utcnow().isoformat(),
+        uptime_seconds=time.time()
+    )
+    log_request(response.status_code, "Health check")
+    
+    return response
 
 
 @app.route('/api/user/<int:user_id>')
@@ -196,8 +647,6 @@ def get_user(user_id):
     参数:
         user_id: 用户ID
     """
-    start_time = time.time()
-    
     # 模拟数据库查询延迟
     time.sleep(random.uniform(0.01, 0.05))
     
@@ -205,8 +654,7 @@ def get_user(user_id):
     if user_id > 1000:
         response = {"error": "User not found"}
         request_counter["count"] += 1
-        response_time = time.time() - start_time
-        log_request(404, response_time, f"User {user_id} not found")
+        log_request(404, f"User {user_id} not found")
         return jsonify(response), 404
     
     response = {
@@ -217,8 +665,7 @@ def get_user(user_id):
     }
     
     request_counter["count"] += 1
-    response_time = time.time() - start_time
-    log_request(200, response_time, f"User {user_id} retrieved")
+    log_request(200, f"User {user_id} retrieved")
     
     return jsonify(response), 200
 
@@ -229,8 +676,6 @@ def order():
     订单接口
     模拟订单创建和查询场景
     """
-    start_time = time.time()
-    
     if request.method == 'POST':
         # 模拟订单创建
         time.sleep(random.uniform(0.05, 0.15))
@@ -244,8 +689,7 @@ def order():
         }
         
         request_counter["count"] += 1
-        response_time = time.time() - start_time
-        log_request(201, response_time, f"Order {order_id} created")
+        log_request(201, f"Order {order_id} created")
         
         return jsonify(response), 201
     
@@ -261,8 +705,7 @@ def order():
         }
         
         request_counter["count"] += 1
-        response_time = time.time() - start_time
-        log_request(200, response_time, "Orders retrieved")
+        log_request(200, "Orders retrieved")
         
         return jsonify(response), 200
 
@@ -276,8 +719,6 @@ def get_product(product_id):
     参数:
         product_id: 商品ID
     """
-    start_time = time.time()
-    
     # 模拟数据库查询
     time.sleep(random.uniform(0.02, 0.06))
     
@@ -290,8 +731,7 @@ def get_product(product_id):
     }
     
     request_counter["count"] += 1
-    response_time = time.time() - start_time
-    log_request(200, response_time, f"Product {product_id} retrieved")
+    log_request(200, f"Product {product_id} retrieved")
     
     return jsonify(response), 200
 
@@ -302,8 +742,6 @@ def login():
     用户登录接口
     模拟用户认证场景
     """
-    start_time = time.time()
-    
     # 模拟认证处理时间
     time.sleep(random.uniform(0.1, 0.2))
     
@@ -311,8 +749,7 @@ def login():
     if random.random() < 0.2:
         response = {"error": "Invalid credentials"}
         request_counter["count"] += 1
-        response_time = time.time() - start_time
-        log_request(401, response_time, "Login failed - Invalid credentials")
+        log_request(401, "Login failed - Invalid credentials")
         return jsonify(response), 401
     
     response = {
@@ -322,8 +759,7 @@ def login():
     }
     
     request_counter["count"] += 1
-    response_time = time.time() - start_time
-    log_request(200, response_time, "User logged in successfully")
+    log_request(200, "User logged in successfully")
     
     return jsonify(response), 200
 
@@ -337,12 +773,10 @@ def error_404():
     """
     模拟 404 错误
     """
-    start_time = time.time()
     response = {"error": "Resource not found"}
     
     request_counter["count"] += 1
-    response_time = time.time() - start_time
-    log_request(404, response_time, "Simulated 404 error")
+    log_request(404, "Simulated 404 error")
     
     return jsonify(response), 404
 
@@ -353,27 +787,14 @@ def error_500():
     模拟 500 服务器错误
     会产生异常堆栈跟踪（多行日志）
     """
-    start_time = time.time()
     request_counter["count"] += 1
     
     try:
         # 故意触发异常
         result = 1 / 0
     except Exception as e:
-        response_time = time.time() - start_time
-        logger.error(
-            "Internal Server Error",
-            exc_info=True,  # 这会记录完整的堆栈跟踪
-            extra={
-                'trace_id': _get_trace_id(),
-                'http_method': request.method,
-                'url': request.url,
-                'status_code': 500,
-                'response_time_ms': round(response_time * 1000, 2),
-                'ip': request.remote_addr,
-                'user_agent': request.headers.get('User-Agent', 'Unknown')
-            }
-        )
+        # 传入 exc_info 会记录完整的堆栈跟踪
+        _defer_request_log(logging.ERROR, "Internal Server Error", 500, exc_info=sys.exc_info())
         
         return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
 
@@ -384,16 +805,13 @@ def error_timeout():
     模拟超时场景
     响应时间超过 3 秒
     """
-    start_time = time.time()
-    
     # 模拟长时间处理
     time.sleep(random.uniform(3.0, 5.0))
     
     response = {"message": "This request took too long"}
     
     request_counter["count"] += 1
-    response_time = time.time() - start_time
-    log_request(200, response_time, f"Slow request - took {response_time:.2f}s")
+    log_request(200, f"Slow request - took {_elapsed_ns() / 1e9:.2f}s")
     
     return jsonify(response), 200
 
@@ -405,18 +823,14 @@ def error_timeout():
 @app.errorhandler(404)
 def not_found(error):
     """全局 404 错误处理"""
-    start_time = time.time()
-    response_time = time.time() - start_time
-    log_request(404, response_time, "Page not found")
+    log_request(404, "Page not found")
     return jsonify({"error": "Not found"}), 404
 
 
 @app.errorhandler(500)
 def internal_error(error):
     """全局 500 错误处理"""
-    start_time = time.time()
-    response_time = time.time() - start_time
-    log_request(500, response_time, "Internal server error")
+    log_request(500, "Internal server error")
     return jsonify({"error": "Internal server error"}), 500
 
 
@@ -424,7 +838,11 @@ def internal_error(error):
 # 应用启动
 # ============================================
 
+# 模块导入完成（路由与错误处理器均已注册）
+startup_timings["import_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 2)
+
 if __name__ == '__main__':
+    init_logging()
     logger.info("=" * 50)
     logger.info("Web Application Starting...")
     logger.info("Service: ELK Log Generator")
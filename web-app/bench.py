@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试工具 - 在本地启动 Gunicorn，对比不同配置下的实际表现
+
+子命令:
+    log-volume   对比默认模式与统一访问日志模式（UNIFIED_ACCESS_LOG）下
+                 每个请求产生的日志事件数和字节数
+    throughput   对比首页与健康检查在 jsonify 与预渲染响应（PRERENDERED_RESPONSES）
+                 下的吞吐量，默认在进程内直接调用 WSGI 应用，--http 时经 Gunicorn
+
+用法示例:
+    python bench.py log-volume
+    python bench.py log-volume --requests 1000 --seed 7
+    python bench.py throughput --requests 20000
+    python bench.py throughput --http --requests 3000
+"""
+
+import argparse
+import io
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import stress_test
+from log_generator import _docker_frame, build_variants
+
+# ============================================
+# 配置参数
+# ============================================
+
+# 应用目录（Gunicorn 在此目录下启动）
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 等待 /readyz 就绪的最长时间（秒）
+READY_TIMEOUT = 30
+
+# 正式计数前的预热请求数（排除每个 worker 首个请求的启动耗时日志）
+WARMUP_REQUESTS = 20
+
+# 发送请求的并发数
+CONCURRENCY = 4
+
+
+# ============================================
+# Gunicorn 进程管理
+# ============================================
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class GunicornServer:
+    """
+    在子进程中以 gunicorn.conf.py 启动应用，stdout 与 stderr 合并写入临时文件
+    （与 Docker 收集容器日志的方式一致）
+    """
+
+    def __init__(self, env=None):
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(os.environ, PYTHONUNBUFFERED="1", **(env or {}))
+        self.log_file = tempfile.NamedTemporaryFile(prefix="bench-", suffix=".log", delete=False)
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+             "--bind", f"127.0.0.1:{self.port}", "app:app"],
+            cwd=APP_DIR, env=self.env, stdout=self.log_file, stderr=subprocess.STDOUT,
+        )
+        deadline = time.time() + READY_TIMEOUT
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Gunicorn 启动失败，日志见 {self.log_file.name}")
+            try:
+                if requests.get(f"{self.base_url}/readyz", timeout=1).status_code == 200:
+                    return self
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("等待 /readyz 超时")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+        self.log_file.close()
+        os.remove(self.log_file.name)
+
+    def log_offset(self):
+        """当前日志文件大小，用于截取某段时间内产生的日志"""
+        self.log_file.flush()
+        return os.path.getsize(self.log_file.name)
+
+    def read_log(self, start, end):
+        with open(self.log_file.name, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+# ============================================
+# 请求负载
+# ============================================
+
+def build_workload(count, seed):
+    """
+    按 stress_test.py 的场景权重生成固定的请求序列（排除慢请求场景，
+    日志量与响应时间无关，排除后基准运行更快）
+
+    返回:
+        list[dict]: 场景列表
+    """
+    rng = random.Random(seed)
+    scenarios, _, weights = build_variants(slow_ratio=0)
+    return rng.choices(scenarios, weights=weights, k=count)
+
+
+def run_workload(base_url, scenarios, seed):
+    """
+    并发发送请求序列
+
+    返回:
+        list[dict]: send_request 的结果
+    """
+    stress_test.TARGET_URL = base_url
+    # 动态 URL 使用全局 random，固定种子使两次运行的请求完全相同
+    random.seed(seed)
+    fixed = [dict(s, url=s["url"]() if callable(s["url"]) else s["url"]) for s in scenarios]
+    agents = [random.choice(stress_test.USER_AGENTS) for _ in fixed]
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        return list(executor.map(stress_test.send_request, fixed, agents))
+
+
+# ============================================
+# log-volume：每请求日志量
+# ============================================
+
+def measure_log_volume(env, scenarios, seed):
+    """
+    启动一次 Gunicorn，发送请求序列，统计期间产生的日志
+
+    返回:
+        dict: requests / events / bytes / docker_bytes 以及按来源（app/access）的细分
+    """
+    with GunicornServer(env) as server:
+        for _ in range(WARMUP_REQUESTS):
+            stress_test.http_session.get(f"{server.base_url}/", timeout=10)
+        time.sleep(0.5)
+
+        start = server.log_offset()
+        results = run_workload(server.base_url, scenarios, seed)
+        time.sleep(0.5)
+        data = server.read_log(start, server.log_offset())
+
+    volume = {"requests": sum(1 for r in results if r["success"]), "events": 0, "bytes": 0,
+              "docker_bytes": 0, "sources": {}}
+    now = time.time()
+    for raw in data.splitlines():
+        line = raw.decode("utf-8", "replace")
+        source = "app" if line.startswith("{") else "access"
+        size = len(raw) + 1
+        docker_size = len(_docker_frame(line, now).encode("utf-8")) + 1
+        volume["events"] += 1
+        volume["bytes"] += size
+        volume["docker_bytes"] += docker_size
+        per_source = volume["sources"].setdefault(source, {"events": 0, "bytes": 0})
+        per_source["events"] += 1
+        per_source["bytes"] += size
+    return volume
+
+
+def cmd_log_volume(args):
+    scenarios = build_workload(args.requests, args.seed)
+    modes = [
+        ("默认（Gunicorn 访问日志 + 应用日志）", {"UNIFIED_ACCESS_LOG": "false"}),
+        ("统一访问日志", {"UNIFIED_ACCESS_LOG": "true"}),
+    ]
+    rows = []
+    for name, env in modes:
+        print(f"⏱️  测量: {name} ...", file=sys.stderr)
+        rows.append((name, measure_log_volume(env, scenarios, args.seed)))
+
+    print(f"{'模式':<24} {'事件/请求':>10} {'字节/请求':>10} {'Docker 封装字节/请求':>20}  细分")
+    for name, v in rows:
+        n = v["requests"] or 1
+        detail = ", ".join(f"{src}: {s['events'] / n:.2f} 事件 {s['bytes'] / n:.0f} B"
+                           for src, s in sorted(v["sources"].items()))
+        print(f"{name:<24} {v['events'] / n:>10.2f} {v['bytes'] / n:>10.0f} {v['docker_bytes'] / n:>20.0f}  {detail}")
+
+    before, after = rows[0][1], rows[1][1]
+    if before["events"] and before["bytes"]:
+        print(f"\n事件数减少 {(1 - after['events'] / before['events']) * 100:.1f}%，"
+              f"字节数减少 {(1 - after['bytes'] / before['bytes']) * 100:.1f}%，"
+              f"Docker 封装后字节数减少 {(1 - after['docker_bytes'] / before['docker_bytes']) * 100:.1f}%"
+              f"（{before['requests']} 个请求）")
+
+
+# ============================================
+# throughput：预渲染响应吞吐量
+# ============================================
+
+# 参与对比的接口
+THROUGHPUT_PATHS = ("/", "/health")
+
+# 进程内测量的轮数：各模式交替测量，每项取最好一轮，减少机器噪声的影响
+THROUGHPUT_ROUNDS = 5
+
+# 对比的三种情况：(名称, 是否预渲染, 是否携带 If-None-Match)
+THROUGHPUT_MODES = (
+    ("jsonify", False, False),
+    ("预渲染", True, False),
+    ("预渲染 + If-None-Match", True, True),
+)
+
+
+def _prerendered(app_module, path):
+    return app_module.INDEX_RESPONSE if path == "/" else app_module.HEALTH_RESPONSE
+
+
+def _sample_values(path):
+    """构建响应时使用的动态字段值"""
+    if path == "/":
+        return {"total_requests": 123456}
+    return {"timestamp": "2025-12-06T10:30:45.123456", "uptime_seconds": 1765017045.123456}
+
+
+def _wsgi_rate(wsgi_app, path, count, headers=None):
+    """
+    进程内直接调用 WSGI 应用，返回每秒请求数（不含网络与 HTTP 解析开销）
+    """
+    from werkzeug.test import EnvironBuilder
+
+    builder = EnvironBuilder(path=path, headers=headers or {})
+    template = builder.get_environ()
+    builder.close()
+    status = []
+
+    def start_response(code, response_headers, exc_info=None):
+        status.append(code)
+
+    started = time.perf_counter()
+    for _ in range(count):
+        environ = dict(template)
+        environ["wsgi.input"] = io.BytesIO()
+        result = wsgi_app(environ, start_response)
+        try:
+            b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+    elapsed = time.perf_counter() - started
+    return count / elapsed, status[-1][:3]
+
+
+def _build_rate(app_module, path, count, headers=None):
+    """只测量视图中构建响应的部分（jsonify 或预渲染拼接），返回每秒次数"""
+    prerendered = _prerendered(app_module, path)
+    values = _sample_values(path)
+    with app_module.app.test_request_context(path, headers=headers or {}):
+        app_module.g.phases = {}
+        started = time.perf_counter()
+        for _ in range(count):
+            response = prerendered.response(**values)
+        elapsed = time.perf_counter() - started
+    return count / elapsed, str(response.status_code)
+
+
+def _http_rate(base_url, path, count, headers=None):
+    """经 HTTP 并发发送请求，返回每秒请求数"""
+    session = stress_test.http_session
+    url = base_url + path
+
+    def get(_):
+        return session.get(url, headers=headers, timeout=10).status_code
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        list(executor.map(get, range(min(count, 50))))
+        started = time.perf_counter()
+        codes = list(executor.map(get, range(count)))
+    return count / (time.perf_counter() - started), str(codes[-1])
+
+
+def _print_rates(title, best):
+    """
+    打印对比表
+
+    参数:
+        best: {(path, 模式名): (每秒次数, 状态)}
+    """
+    print(f"\n{title}")
+    print(f"{'接口':<10} {'模式':<24} {'次/秒':>10} {'微秒/次':>10} {'状态':>6} {'提升':>7}")
+    for path in THROUGHPUT_PATHS:
+        baseline = best[(path, THROUGHPUT_MODES[0][0])][0]
+        for name, _, _ in THROUGHPUT_MODES:
+            value, status = best[(path, name)]
+            gain = "-" if value == baseline and name == THROUGHPUT_MODES[0][0] else f"{value / baseline:.2f}x"
+            print(f"{path:<10} {name:<24} {value:>10.0f} {1e6 / value:>10.1f} {status:>6} {gain:>7}")
+
+
+def _measure_in_process(app_module, rate, count, rounds):
+    """各模式交替测量 rounds 轮，每项保留最好的一轮"""
+    best = {}
+    previous = app_module.PRERENDERED_RESPONSES
+    for _ in range(rounds):
+        for path in THROUGHPUT_PATHS:
+            etag = _prerendered(app_module, path).etag_header
+            for name, enabled, conditional in THROUGHPUT_MODES:
+                app_module.PRERENDERED_RESPONSES = enabled
+                headers = {"If-None-Match": etag} if conditional else None
+                result = rate(path, count, headers)
+                if (path, name) not in best or result[0] > best[(path, name)][0]:
+                    best[(path, name)] = result
+    app_module.PRERENDERED_RESPONSES = previous
+    return best
+
+
+def _measure_http(count):
+    """分别以两种模式启动 Gunicorn 并经 HTTP 测量"""
+    best = {}
+    for enabled in (False, True):
+        env = {
+            "PRERENDERED_RESPONSES": "true" if enabled else "false",
+            # 关闭 Gunicorn 访问日志，每个请求只写一条日志
+            "UNIFIED_ACCESS_LOG": "true",
+        }
+        with GunicornServer(env) as server:
+            for path in THROUGHPUT_PATHS:
+                etag = stress_test.http_session.get(server.base_url + path, timeout=10).headers.get("ETag")
+                for name, mode_enabled, conditional in THROUGHPUT_MODES:
+                    if mode_enabled != enabled:
+                        continue
+                    headers = {"If-None-Match": etag} if conditional else None
+                    best[(path, name)] = _http_rate(server.base_url, path, count, headers)
+    return best
+
+
+def cmd_throughput(args):
+    if args.http:
+        print(f"⏱️  经 Gunicorn 测量（并发 {CONCURRENCY}，每项 {args.requests} 个请求）...", file=sys.stderr)
+        _print_rates("HTTP 吞吐量（Gunicorn）", _measure_http(args.requests))
+        return
+
+    import app
+
+    print(f"⏱️  进程内测量（{args.rounds} 轮，每轮每项 {args.requests} 个请求）...", file=sys.stderr)
+    # 请求日志照常格式化，但写入 /dev/null
+    app.init_logging()
+    with open(os.devnull, "w") as devnull:
+        app._logging_state["console_handler"].setStream(devnull)
+        requests_best = _measure_in_process(
+            app, lambda path, count, headers: _wsgi_rate(app.app, path, count, headers),
+            args.requests, args.rounds)
+        build_best = _measure_in_process(
+            app, lambda path, count, headers: _build_rate(app, path, count, headers),
+            args.requests, args.rounds)
+        app._logging_state["console_handler"].setStream(sys.stdout)
+
+    _print_rates("完整请求（进程内 WSGI，含钩子与请求日志）", requests_best)
+    _print_rates("仅构建响应（jsonify / 预渲染拼接）", build_best)
+
+
+# ============================================
+# 命令行
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Web 应用基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("log-volume", help="对比默认模式与统一访问日志模式的每请求日志量")
+    p.add_argument("--requests", type=int, default=500, help="请求数")
+    p.add_argument("--seed", type=int, default=42, help="请求序列随机种子")
+    p.set_defaults(func=cmd_log_volume)
+
+    p = sub.add_parser("throughput", help="对比首页与健康检查的 jsonify / 预渲染响应吞吐量")
+    p.add_argument("--requests", type=int, default=5000, help="每项（进程内为每轮每项）测量的请求数")
+    p.add_argument("--rounds", type=int, default=THROUGHPUT_ROUNDS, help="进程内测量轮数（每项取最好一轮）")
+    p.add_argument("--http", action="store_true", help="经 Gunicorn 通过 HTTP 测量（默认进程内调用 WSGI）")
+    p.set_defaults(func=cmd_throughput)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
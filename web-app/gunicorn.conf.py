@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn 配置
+
+preload_app 让 master 只导入一次应用，worker fork 后直接复用，缩短冷启动；
+日志处理器和后台线程在 post_fork 中按 worker 初始化。
+"""
+
+import os
+
+# 监听所有网络接口
+bind = "0.0.0.0:8000"
+
+# 工作进程数
+workers = 2
+
+# 访问日志输出到 stdout，错误日志输出到 stderr；
+# 开启统一访问日志（UNIFIED_ACCESS_LOG=true）时由应用的请求日志代替，关闭 Gunicorn 访问日志
+UNIFIED_ACCESS_LOG = os.environ.get("UNIFIED_ACCESS_LOG", "false").lower() in ("1", "true", "yes")
+accesslog = None if UNIFIED_ACCESS_LOG else "-"
+errorlog = "-"
+loglevel = "info"
+
+# 在 master 中预加载应用
+preload_app = True
+
+
+# 共享内存日志环形缓冲区（LOG_RING_ENABLED=true）：worker 日志写入各自的缓冲区，
+# 由 master 启动的转发进程统一写出，详见 log_ring.py
+LOG_RING_ENABLED = os.environ.get("LOG_RING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+def when_ready(server):
+    """
+    master 就绪、fork worker 之前：分配缓冲区，启动转发进程及其监控线程
+
+    平滑重启（HUP）时新 worker 启动后旧 worker 才退出，槽位按 worker 数加倍分配；
+    转发进程只能看到此时已分配的缓冲区，之后不再追加
+    """
+    if not LOG_RING_ENABLED:
+        return
+    import log_ring
+    rings = log_ring.allocate(server.num_workers * log_ring.LOG_RING_SLOTS_PER_WORKER)
+
+    def listener_fds():
+        return [listener.fileno() for listener in server.LISTENERS]
+
+    pid = log_ring.start_shipper(close_fds=listener_fds())
+    server.log.info("Log shipper started (pid: %s, rings: %s x %s bytes)",
+                    pid, len(rings), log_ring.LOG_RING_SIZE)
+    # 转发进程意外退出时由 master 中的监控线程输出错误并重新启动
+    log_ring.supervise_shipper(listener_fds, server.log)
+
+
+def pre_fork(server, worker):
+    """fork worker 之前在 master 中为其选择一个未被存活 worker 占用的槽位"""
+    if not LOG_RING_ENABLED:
+        return
+    import log_ring
+    used = {getattr(w, "log_ring_slot", None) for w in server.WORKERS.values()}
+    worker.log_ring_slot = log_ring.free_slot(used)
+
+
+def post_fork(server, worker):
+    """worker fork 之后初始化日志管道（线程不能跨 fork 继承）"""
+    import time
+    forked_at = time.perf_counter()
+    if LOG_RING_ENABLED:
+        import logging
+        import log_ring
+        ring = log_ring.attach(worker.log_ring_slot)
+        if ring is None:
+            server.log.warning("No free log ring slot for worker %s, writing to stdout", worker.pid)
+        else:
+            # Gunicorn 访问日志（输出到 stdout 时）也改为写入缓冲区
+            access_log = server.log.access_log
+            for handler in list(access_log.handlers):
+                if getattr(handler, "_gunicorn", False) and isinstance(handler, logging.StreamHandler) \
+                        and not isinstance(handler, logging.FileHandler):
+                    ring_handler = log_ring.RingBufferHandler(ring)
+                    ring_handler.setFormatter(handler.formatter)
+                    access_log.removeHandler(handler)
+                    access_log.addHandler(ring_handler)
+    from app import init_logging
+    init_logging(process_started=forked_at)
+
+
+def on_exit(server):
+    """master 退出前（worker 均已停止）：通知转发进程清空缓冲区后退出"""
+    if LOG_RING_ENABLED:
+        import log_ring
+        log_ring.stop_shipper()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成日志生成器 - 不经过 HTTP，直接生成与应用输出逐字节一致的日志行
+
+功能:
+1. 复用 app.py 的 JsonFormatter 与请求日志消息规则，以及 stress_test.py 的
+   SCENARIOS 权重与 USER_AGENTS，生成与真实请求日志格式完全一致的 JSON 行
+2. 支持纯 JSON 行或 Docker json-file 封装（用于 Filebeat container 输入）
+3. 固定种子可复现；按块并行生成，输出顺序与进程数无关
+4. 可控制错误响应比例、慢请求比例和时间戳分布范围
+
+用法示例:
+    python log_generator.py --count 1000000 --output app.log
+    python log_generator.py --count 5000000 --format docker --processes 8 --output web-app-json.log
+    python log_generator.py --count 100000 --error-ratio 0.3 --slow-ratio 0.05 --span 1h
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from multiprocessing import Pool
+
+import app
+from log_query import parse_duration, parse_timestamp
+from stress_test import SCENARIOS, USER_AGENTS
+
+# ============================================
+# 配置参数
+# ============================================
+
+# 每个生成块的行数（每块使用独立的随机种子，保证并行结果可复现）
+CHUNK_SIZE = 20000
+
+# 请求 URL 的主机部分（对应 Flask request.url）
+DEFAULT_HOST = "http://localhost:8000"
+
+# 客户端 IP（容器内看到的是 Docker 网桥网关地址）
+DEFAULT_CLIENT_IP = "172.18.0.1"
+
+# 服务端在 handler 之外的耗时范围（秒）：钩子、序列化
+SERVER_OVERHEAD = (0.0001, 0.0004)
+
+# 判定慢请求场景用的 URL 规则
+SLOW_PATTERN = re.compile(r"^/error/timeout")
+
+# 估计场景自然错误率时的抽样次数
+ERROR_RATE_SAMPLES = 2000
+
+
+# ============================================
+# 路由行为模型（与 app.py 中各接口一致）
+# ============================================
+
+def _route(method, path, rng):
+    """
+    模拟路由处理结果
+
+    参数:
+        method: HTTP 方法
+        path: 请求路径
+        rng: random.Random
+
+    返回:
+        tuple: (状态码, 附加消息, handler 耗时秒数, 是否产生异常)
+    """
+    if path == "/":
+        return 200, "Homepage accessed", rng.uniform(0.00003, 0.0002), False
+    if path == "/health":
+        return 200, "Health check", rng.uniform(0.00003, 0.0002), False
+    if path.startswith("/api/user/"):
+        user_id = int(path.rsplit("/", 1)[1])
+        latency = rng.uniform(0.01, 0.05)
+        if user_id > 1000:
+            return 404, f"User {user_id} not found", latency, False
+        return 200, f"User {user_id} retrieved", latency, False
+    if path.startswith("/api/product/"):
+        product_id = int(path.rsplit("/", 1)[1])
+        return 200, f"Product {product_id} retrieved", rng.uniform(0.02, 0.06), False
+    if path == "/api/order":
+        if method == "POST":
+            return 201, f"Order {rng.randint(10000, 99999)} created", rng.uniform(0.05, 0.15), False
+        return 200, "Orders retrieved", rng.uniform(0.02, 0.08), False
+    if path == "/api/login":
+        latency = rng.uniform(0.1, 0.2)
+        if rng.random() < 0.2:
+            return 401, "Login failed - Invalid credentials", latency, False
+        return 200, "User logged in successfully", latency, False
+    if path == "/error/404":
+        return 404, "Simulated 404 error", rng.uniform(0.00003, 0.0002), False
+    if path == "/error/500":
+        return 500, "", rng.uniform(0.00005, 0.0003), True
+    if path == "/error/timeout":
+        latency = rng.uniform(3.0, 5.0)
+        return 200, f"Slow request - took {latency:.2f}s", latency, False
+    return 404, "Page not found", rng.uniform(0.00003, 0.0002), False
+
+
+def _error_rate(scenario, samples=ERROR_RATE_SAMPLES):
+    """
+    用固定种子抽样估计场景返回错误响应（状态码 >= 400）的比例
+
+    /api/user 的部分 ID、/api/login 的部分请求也会返回 404/401，
+    不能只按 URL 判断；抽样前后保存并恢复全局 random 的状态（动态 URL 使用全局 random）
+    """
+    state = random.getstate()
+    random.seed(0)
+    rng = random.Random(0)
+    try:
+        url = scenario["url"]
+        errors = 0
+        for _ in range(samples):
+            path = url() if callable(url) else url
+            if _route(scenario["method"], path, rng)[0] >= 400:
+                errors += 1
+    finally:
+        random.setstate(state)
+    return errors / samples
+
+
+def build_variants(error_ratio=None, slow_ratio=None):
+    """
+    计算场景变体及其权重
+
+    默认使用 SCENARIOS 中的原始权重；指定 slow_ratio 时，将慢请求场景的权重缩放到目标占比；
+    指定 error_ratio 时，控制的是错误响应（状态码 >= 400）的占比：同时可能成功或失败的场景
+    （如 /api/user、/api/login）按其自然错误率拆成成功、失败两个变体，生成时只保留对应结果，
+    所有错误变体按原有错误量的比例分配 error_ratio；其余场景按原比例分配剩余部分
+
+    返回:
+        tuple: (场景列表, 结果列表, 权重列表)，三者一一对应；结果为 None（不限定）、
+               "ok"（只生成成功响应）或 "error"（只生成错误响应）
+    """
+    fixed = sum(r for r in (error_ratio, slow_ratio) if r is not None)
+    if fixed > 1:
+        raise ValueError("error_ratio 与 slow_ratio 之和不能超过 1")
+
+    variants = []
+    for scenario in SCENARIOS:
+        weight = float(scenario["weight"])
+        url = scenario["url"]
+        if SLOW_PATTERN.match(url() if callable(url) else url):
+            variants.append((scenario, None, weight, "slow"))
+            continue
+        rate = _error_rate(scenario) if error_ratio is not None else 0.0
+        if rate >= 1.0:
+            variants.append((scenario, "error", weight, "error"))
+        elif rate <= 0.0:
+            variants.append((scenario, None, weight, "normal"))
+        else:
+            variants.append((scenario, "ok", weight * (1 - rate), "normal"))
+            variants.append((scenario, "error", weight * rate, "error"))
+
+    targets = {"error": error_ratio, "slow": slow_ratio}
+    totals = {}
+    for _, _, w, cls in variants:
+        totals[cls] = totals.get(cls, 0.0) + w
+    free = sum(totals[c] for c in totals if targets.get(c) is None)
+
+    weights = []
+    for _, _, w, cls in variants:
+        target = targets.get(cls)
+        if target is not None:
+            weights.append(w / totals[cls] * target if totals[cls] else 0.0)
+        else:
+            weights.append(w / free * (1 - fixed) if free else 0.0)
+    return [v[0] for v in variants], [v[1] for v in variants], weights
+
+
+# ============================================
+# 日志记录模板（从真实请求中获取）
+# ============================================
+
+_templates = {}
+
+
+def calibrate():
+    """
+    通过 Flask 测试客户端各执行一次 /error/404 与 /error/500，
+    记录请求日志的输出位置（模块、函数、行号）和真实的异常信息，
+    使生成的日志与应用输出逐字节一致；捕获的记录不会输出
+    """
+    if _templates:
+        return _templates
+    captured = []
+
+    def capture(record):
+        if hasattr(record, "http_method"):
+            captured.append(record)
+        return False
+
+    app.logger.addFilter(capture)
+    try:
+        client = app.app.test_client()
+        client.get("/error/404")
+        client.get("/error/500")
+    finally:
+        app.logger.removeFilter(capture)
+
+    request_record, error_record = captured[0], captured[1]
+    _templates["pathname"] = request_record.pathname
+    _templates["lineno"] = request_record.lineno
+    _templates["func"] = request_record.funcName
+    _templates["exc_info"] = error_record.exc_info
+    _templates["error_message"] = error_record.getMessage()
+    return _templates
+
+
+# ============================================
+# 行生成
+# ============================================
+
+_formatter = app.JsonFormatter()
+
+
+def _docker_time(ts):
+    """Docker json-file 的 RFC3339Nano 时间（纳秒精度）"""
+    seconds = int(ts)
+    nanos = int(round((ts - seconds) * 1e9))
+    if nanos >= 1_000_000_000:
+        seconds, nanos = seconds + 1, nanos - 1_000_000_000
+    base = datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    return f"{base}.{nanos:09d}Z"
+
+
+def _docker_frame(line, ts):
+    """按 Docker json-file 驱动的格式封装一行（与 Go 的 JSON 编码一样转义 < > &）"""
+    encoded = json.dumps({"log": line + "\n", "stream": "stdout", "time": _docker_time(ts)},
+                         ensure_ascii=False, separators=(",", ":"))
+    return encoded.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+
+
+def generate_chunk(task):
+    """
+    生成一个块的日志
+
+    参数:
+        task: (块编号, 行数, 配置字典)
+
+    返回:
+        bytes: 以换行分隔的日志行
+    """
+    index, count, config = task
+    templates = calibrate()
+    rng = random.Random(config["seed"] * 1_000_003 + index)
+
+    variants = config["variants"]
+    cum_weights = config["cum_weights"]
+    total = config["total"]
+    start = config["start"]
+    step = config["span"] / total
+    host = config["host"]
+    client_ip = config["client_ip"]
+    docker = config["format"] == "docker"
+    # 每个日志级别预先构造一条 LogRecord，逐行只复制属性字典，省去 LogRecord.__init__
+    bases = {
+        level: logging.LogRecord("web_app", level, templates["pathname"], templates["lineno"],
+                                 "", None, None, templates["func"]).__dict__
+        for level in (logging.INFO, logging.WARNING, logging.ERROR)
+    }
+    new_record = logging.LogRecord.__new__
+
+    # stress_test 中动态 URL 使用全局 random，生成前用块种子固定
+    random.seed(rng.random())
+
+    lines = []
+    first = index * config["chunk_size"]
+    for offset in range(count):
+        position = first + offset
+        ts = start + (position + rng.random()) * step
+
+        scenario_index, outcome = rng.choices(variants, cum_weights=cum_weights)[0]
+        scenario = SCENARIOS[scenario_index]
+        url = scenario["url"]
+        method = scenario["method"]
+        while True:
+            path = url() if callable(url) else url
+            status_code, extra_msg, handler, failed = _route(method, path, rng)
+            # 限定了结果的变体：重新抽取，直到成功/失败与变体一致
+            if outcome is None or (status_code >= 400) == (outcome == "error"):
+                break
+        server = handler + rng.uniform(*SERVER_OVERHEAD)
+
+        if failed:
+            level, message = logging.ERROR, templates["error_message"]
+            exc_info = templates["exc_info"]
+        else:
+            level, message = app.request_log_message(status_code, extra_msg)
+            exc_info = None
+
+        record = new_record(logging.LogRecord)
+        record.__dict__.update(bases[level])
+        record.msg = message
+        record.exc_info = exc_info
+        record.created = ts + server
+        record.trace_id = "%032x" % rng.getrandbits(128)
+        record.http_method = method
+        record.url = host + path
+        record.status_code = status_code
+        record.response_time_ms = round(server * 1000, 2)
+        record.handler_time_ms = round(handler * 1000, 2)
+        record.ip = client_ip
+        record.user_agent = rng.choice(USER_AGENTS)
+
+        line = _formatter.format(record)
+        lines.append(_docker_frame(line, record.created + 0.00005) if docker else line)
+
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+# ============================================
+# 主函数
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合成 Web 应用日志生成器")
+    parser.add_argument("--count", type=int, default=1000000, help="生成的行数")
+    parser.add_argument("--output", default="-", help="输出文件，- 表示标准输出")
+    parser.add_argument("--format", choices=["json", "docker"], default="json",
+                        help="json: 应用原始输出；docker: Docker json-file 封装")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--error-ratio", type=float, default=None,
+                        help="错误响应（状态码 >= 400，含 /api/user 的 404 与 /api/login 的 401）占比，"
+                             "默认沿用 SCENARIOS 权重")
+    parser.add_argument("--slow-ratio", type=float, default=None,
+                        help="慢请求（/error/timeout）占比，默认沿用 SCENARIOS 权重")
+    parser.add_argument("--start", default=None, help="起始时间（ISO8601），默认当前时间减去 span")
+    parser.add_argument("--span", default="1h", help="时间戳分布跨度，如 10m / 1h / 1d")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="请求 URL 的主机部分")
+    parser.add_argument("--client-ip", default=DEFAULT_CLIENT_IP, help="客户端 IP")
+    args = parser.parse_args(argv)
+    for name, ratio in (("--error-ratio", args.error_ratio), ("--slow-ratio", args.slow_ratio)):
+        if ratio is not None and not 0 <= ratio <= 1:
+            parser.error(f"{name} 必须在 0 到 1 之间")
+    if (args.error_ratio or 0) + (args.slow_ratio or 0) > 1:
+        parser.error("--error-ratio 与 --slow-ratio 之和不能超过 1")
+
+    span = parse_duration(args.span)
+    start = parse_timestamp(args.start) / 1000.0 if args.start else time.time() - span
+    scenarios, outcomes, weights = build_variants(args.error_ratio, args.slow_ratio)
+    cum_weights = []
+    acc = 0.0
+    for w in weights:
+        acc += w
+        cum_weights.append(acc)
+
+    config = {
+        "seed": args.seed,
+        # 场景含 lambda，无法随任务传给子进程，只传下标
+        "variants": [(SCENARIOS.index(s), o) for s, o in zip(scenarios, outcomes)],
+        "cum_weights": cum_weights,
+        "total": args.count,
+        "start": start,
+        "span": span,
+        "host": args.host,
+        "client_ip": args.client_ip,
+        "format": args.format,
+        "chunk_size": CHUNK_SIZE,
+    }
+    tasks = [
+        (i, min(CHUNK_SIZE, args.count - i * CHUNK_SIZE), config)
+        for i in range((args.count + CHUNK_SIZE - 1) // CHUNK_SIZE)
+    ]
+
+    # 在父进程完成校准，fork 出的子进程直接继承
+    calibrate()
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    started = time.perf_counter()
+    written = 0
+    try:
+        if args.processes > 1:
+            with Pool(args.processes) as pool:
+                for data in pool.imap(generate_chunk, tasks):
+                    out.write(data)
+                    written += len(data)
+        else:
+            for task in tasks:
+                data = generate_chunk(task)
+                out.write(data)
+                written += len(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        else:
+            out.flush()
+
+    elapsed = time.perf_counter() - started
+    print(f"生成 {args.count} 行 / {written / 1e6:.1f} MB，用时 {elapsed:.2f}s，"
+          f"{args.count / elapsed * 60 / 1e6:.2f} 百万行/分钟", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
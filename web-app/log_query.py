@@ -0,0 +1,1144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地日志分析查询引擎 - 无需 Elasticsearch 即可回答常见问题
+
+功能:
+1. 导入 Web 应用 JSON 日志（支持 Docker json-file 封装格式）
+2. 按时间分区存储为列式段（segment），每段维护字段字典与倒排表
+3. 支持过滤聚合：分位数、terms、日期直方图、统计值
+4. 命令行提供与 slow-request-watcher / error-rate-watcher 一致的告警条件
+
+用法示例:
+    python log_query.py ingest --store ./logstore app.log
+    python log_query.py percentiles --store ./logstore --path /api/login --last 1h
+    python log_query.py top-slow --store ./logstore --last 1h
+    python log_query.py slow-requests --store ./logstore --now latest
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# ============================================
+# 配置参数
+# ============================================
+
+# 每个段覆盖的时间跨度（秒），按小时分区
+SEGMENT_SPAN = 3600
+
+# severity 取值（与 Logstash pipeline 中的 severity 一致）
+SEVERITIES = ("INFO", "WARNING", "ERROR")
+
+# 慢请求告警条件（对应 elasticsearch/watchers/slow-request-watcher.json）
+SLOW_REQUEST_THRESHOLD_MS = 1000
+SLOW_REQUEST_COUNT_THRESHOLD = 5
+
+# 错误率告警条件（对应 elasticsearch/watchers/error-rate-watcher.json）
+ERROR_COUNT_THRESHOLD = 10
+
+# 告警统计窗口（秒），对应 watcher 中的 now-5m
+WATCH_WINDOW = 300
+
+# 列定义: 列名 -> array typecode
+COLUMNS = {
+    "ts": "q",          # 事件时间（毫秒时间戳）
+    "rt": "f",          # response_time_ms，缺失为 NaN
+    "status": "H",      # status_code，缺失为 0
+    "path": "I",        # url_path 字典编码
+    "method": "I",      # http_method 字典编码
+    "severity": "B",    # SEVERITIES 下标
+}
+
+# 字典编码的列（每个段各自维护字典，编码 0 固定表示缺失）
+DICT_COLUMNS = ("path", "method")
+
+# 建立倒排表的列
+POSTING_COLUMNS = ("path", "status", "severity")
+
+# 段文件格式版本（2: 持久化倒排表、区间统计与 response_time_ms 前缀和）
+SEGMENT_FORMAT = 2
+
+# 时间单位（用于 --last / --interval 参数）
+TIME_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+# ============================================
+# 日志解析
+# ============================================
+
+def parse_timestamp(value):
+    """
+    解析 ISO8601 时间戳为毫秒时间戳
+
+    参数:
+        value: 形如 2025-12-06T10:30:45.123456Z 的字符串
+
+    返回:
+        int: 毫秒时间戳
+    """
+    if value.endswith("Z"):
+        value = value[:-1]
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def extract_url_path(url):
+    """
+    从完整 URL 中提取路径（与 Logstash 中 url_path 的 grok 规则一致）
+
+    参数:
+        url: 完整 URL 或路径
+
+    返回:
+        str: URL 路径，不含查询参数
+    """
+    if not url:
+        return ""
+    if "://" in url:
+        return urlsplit(url).path or "/"
+    return url.split("?", 1)[0]
+
+
+def to_severity(level, status_code):
+    """
+    计算 severity（与 Logstash pipeline 的规则一致）
+
+    日志级别优先；INFO 日志再根据状态码兜底为 WARNING/ERROR
+
+    参数:
+        level: 日志级别
+        status_code: HTTP 状态码，可为 None
+
+    返回:
+        str: INFO / WARNING / ERROR
+    """
+    if level in ("ERROR", "FATAL", "CRITICAL"):
+        return "ERROR"
+    if level in ("WARN", "WARNING"):
+        return "WARNING"
+    if status_code:
+        if status_code >= 500:
+            return "ERROR"
+        if status_code >= 400:
+            return "WARNING"
+    return "INFO"
+
+
+def parse_line(line):
+    """
+    解析一行日志为事件字典
+
+    支持应用直接输出的 JSON 行，以及 Docker json-file 驱动的
+    {"log": "...", "stream": "stdout", "time": "..."} 封装格式。
+    非 JSON 行（如 Gunicorn 访问日志）返回 None。
+
+    参数:
+        line: 日志行（str 或 bytes）
+
+    返回:
+        dict | None: 包含 ts/url_path/status_code/response_time_ms/
+                     http_method/severity 的事件字典
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", "replace")
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+
+    # Docker json-file 封装
+    if "log" in record and "stream" in record:
+        inner = record["log"].strip()
+        if not inner.startswith("{"):
+            return None
+        try:
+            record = json.loads(inner)
+        except ValueError:
+            return None
+
+    timestamp = record.get("timestamp")
+    if not timestamp:
+        return None
+    try:
+        ts = parse_timestamp(timestamp)
+    except ValueError:
+        return None
+
+    status_code = record.get("status_code")
+    level = record.get("level", "INFO")
+    if record.get("exception"):
+        level = "ERROR"
+
+    return {
+        "ts": ts,
+        "url_path": extract_url_path(record.get("url")),
+        "status_code": int(status_code) if status_code is not None else None,
+        "response_time_ms": record.get("response_time_ms"),
+        "http_method": record.get("http_method") or "",
+        "severity": to_severity(level, status_code),
+        "trace_id": record.get("trace_id"),
+    }
+
+
+def iter_events(paths):
+    """
+    逐行读取日志文件并解析（流式，不整体载入内存）
+
+    参数:
+        paths: 文件路径列表，"-" 表示标准输入
+
+    返回:
+        generator: 事件字典
+    """
+    for path in paths:
+        if path == "-":
+            stream = sys.stdin.buffer
+        else:
+            stream = open(path, "rb")
+        try:
+            for line in stream:
+                event = parse_line(line)
+                if event is not None:
+                    yield event
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+
+# ============================================
+# 列式段
+# ============================================
+
+class Segment:
+    """
+    时间分区段
+
+    每个段保存一个时间分区内的所有事件，按列存储；
+    字符串列使用段内字典编码，封存（seal）时按 ts 排序所有列并构建倒排表、
+    response_time_ms 前缀和与区间统计。查询时按区间统计直接跳过整个段，
+    段内按时间二分定位行区间，计数和均值由倒排表切片长度与前缀和之差得到。
+    打开存储时只读取 meta.json（字典与区间统计），列与倒排表在段被查询选中时才以只读
+    mmap 映射（memoryview），查询只触及实际访问的页；追加数据前再复制为 array。
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.dicts = {name: [""] for name in DICT_COLUMNS}
+        self._codes = {name: {"": 0} for name in DICT_COLUMNS}
+        self.min_ts = None
+        self.max_ts = None
+        self.max_rt = float("nan")
+        self.rows = 0
+        self.sealed = True      # 倒排表与前缀和是否与列一致
+        self.saved = False      # 磁盘上的副本是否为最新
+        self._directory = None  # 尚未读取列数据的段目录（延迟加载）
+        self._meta = None
+        self._columns = {name: array(code) for name, code in COLUMNS.items()}
+        self._postings = {name: {} for name in POSTING_COLUMNS}
+        self._posting_rt = {name: {} for name in POSTING_COLUMNS}
+        self._rt_prefix = _rt_prefix(())
+
+    def __len__(self):
+        return self.rows
+
+    # ---------- 延迟加载的数据 ----------
+
+    @property
+    def columns(self):
+        self._ensure_loaded()
+        return self._columns
+
+    @property
+    def postings(self):
+        """倒排表: 列名 -> 键 -> 升序行号数组"""
+        self._ensure_loaded()
+        return self._postings
+
+    @property
+    def posting_rt(self):
+        """倒排表对应的 response_time_ms 前缀: 列名 -> 键 -> (前缀和, 有效值前缀计数)"""
+        self._ensure_loaded()
+        return self._posting_rt
+
+    @property
+    def rt_prefix(self):
+        """全部行的 response_time_ms 前缀: (前缀和, 有效值前缀计数)"""
+        self._ensure_loaded()
+        return self._rt_prefix
+
+    def _encode(self, name, value):
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = len(self.dicts[name])
+            codes[value] = code
+            self.dicts[name].append(value)
+        return code
+
+    def _materialize(self):
+        """将只读映射的列复制为可追加的 array"""
+        cols = self.columns
+        for name, column in cols.items():
+            if not isinstance(column, array):
+                cols[name] = array(COLUMNS[name], column.tobytes())
+        return cols
+
+    def append(self, event):
+        """追加一条事件（段被修改后需重新 seal）"""
+        cols = self._materialize()
+        ts = event["ts"]
+        rt = event["response_time_ms"]
+        cols["ts"].append(ts)
+        cols["rt"].append(float(rt) if rt is not None else math.nan)
+        cols["status"].append(event["status_code"] or 0)
+        cols["path"].append(self._encode("path", event["url_path"]))
+        cols["method"].append(self._encode("method", event["http_method"]))
+        cols["severity"].append(SEVERITIES.index(event["severity"]))
+        self.rows += 1
+        self.sealed = False
+        self.saved = False
+
+    def seal(self):
+        """
+        按 ts 排序并构建倒排表、前缀和与区间统计
+
+        倒排表: path 编码 / status_code / severity 下标 -> 升序行号数组
+        """
+        cols = self._materialize()
+        if not len(self):
+            return
+        ts = cols["ts"]
+        if any(a > b for a, b in zip(ts, islice(ts, 1, None))):
+            order = sorted(range(len(ts)), key=ts.__getitem__)
+            for name, column in cols.items():
+                cols[name] = array(column.typecode, (column[row] for row in order))
+            ts = cols["ts"]
+        rt = cols["rt"]
+        self.min_ts = ts[0]
+        self.max_ts = ts[-1]
+        rts = [value for value in rt if value == value]
+        self.max_rt = max(rts) if rts else math.nan
+        self._rt_prefix = _rt_prefix(rt)
+
+        postings = {name: defaultdict(lambda: array("I")) for name in POSTING_COLUMNS}
+        for name in POSTING_COLUMNS:
+            table = postings[name]
+            for row, key in enumerate(cols[name]):
+                table[key].append(row)
+        self._postings = {name: dict(table) for name, table in postings.items()}
+        self._posting_rt = {
+            name: {key: _rt_prefix(rt[row] for row in rows) for key, rows in table.items()}
+            for name, table in self._postings.items()
+        }
+        self.sealed = True
+
+    def row_range(self, since=None, until=None):
+        """时间区间 [since, until) 对应的行区间（段已按 ts 排序）"""
+        ts = self.columns["ts"]
+        lo = 0 if since is None else bisect_left(ts, since)
+        hi = len(ts) if until is None else bisect_left(ts, until)
+        return lo, hi
+
+    # ---------- 持久化 ----------
+
+    def save(self, directory):
+        """将段写入目录（列文件、倒排表、前缀和 + meta.json）"""
+        os.makedirs(directory, exist_ok=True)
+
+        # 先写临时文件再替换：旧文件可能仍被映射，不能原地截断
+        def write(name, arrays):
+            path = os.path.join(directory, f"{name}.bin")
+            with open(path + ".tmp", "wb") as f:
+                for values in arrays:
+                    f.write(values)
+            os.replace(path + ".tmp", path)
+
+        for name, column in self.columns.items():
+            write(name, [column])
+        write("rt_sum", [self.rt_prefix[0]])
+        write("rt_count", [self.rt_prefix[1]])
+        # 倒排表：每列一组文件，依次存放各个键的行号数组（及长度 +1 的前缀数组），
+        # meta 中记录 [键, 长度]
+        postings = {}
+        for name, table in self.postings.items():
+            keys = sorted(table)
+            write(f"postings_{name}", [table[key] for key in keys])
+            write(f"postings_{name}_rt_sum", [self.posting_rt[name][key][0] for key in keys])
+            write(f"postings_{name}_rt_count", [self.posting_rt[name][key][1] for key in keys])
+            postings[name] = [[key, len(table[key])] for key in keys]
+        meta = {
+            "format": SEGMENT_FORMAT,
+            "start": self.start,
+            "rows": len(self),
+            "dicts": self.dicts,
+            "zone": {"min_ts": self.min_ts, "max_ts": self.max_ts,
+                     "max_rt": None if self.max_rt != self.max_rt else self.max_rt},
+            "postings": postings,
+        }
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        self.saved = True
+
+    @classmethod
+    def load(cls, directory):
+        """
+        打开目录中的段，只读取 meta.json
+
+        列与倒排表在首次访问时读取；旧格式（缺少倒排表/前缀和）的段立即读取并重新 seal，
+        下次 save 时按新格式写回
+        """
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        segment = cls(meta["start"])
+        segment.rows = meta["rows"]
+        segment.dicts = meta["dicts"]
+        segment._codes = {
+            name: {value: code for code, value in enumerate(values)}
+            for name, values in segment.dicts.items()
+        }
+        segment._meta = meta
+        segment._directory = directory
+        if meta.get("format") != SEGMENT_FORMAT:
+            segment._ensure_loaded()
+            segment.seal()
+            return segment
+
+        zone = meta["zone"]
+        segment.min_ts, segment.max_ts = zone["min_ts"], zone["max_ts"]
+        segment.max_rt = math.nan if zone["max_rt"] is None else zone["max_rt"]
+        segment.saved = True
+        return segment
+
+    def _ensure_loaded(self):
+        """映射延迟加载的列、倒排表与前缀和"""
+        directory = self._directory
+        if directory is None:
+            return
+        self._directory = None
+        meta = self._meta
+        rows = meta["rows"]
+
+        def read(name, typecode, count):
+            if not count:
+                return array(typecode)
+            with open(os.path.join(directory, f"{name}.bin"), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(mapped).cast(typecode)[:count]
+
+        for name, code in COLUMNS.items():
+            self._columns[name] = read(name, code, rows)
+        if meta.get("format") != SEGMENT_FORMAT:
+            return
+
+        self._rt_prefix = (read("rt_sum", "d", rows + 1), read("rt_count", "I", rows + 1))
+        for name, entries in meta["postings"].items():
+            total = sum(length for _, length in entries)
+            rows_all = read(f"postings_{name}", "I", total)
+            sums = read(f"postings_{name}_rt_sum", "d", total + len(entries))
+            counts = read(f"postings_{name}_rt_count", "I", total + len(entries))
+            table, prefixes = {}, {}
+            offset = prefix_offset = 0
+            for key, length in entries:
+                table[key] = rows_all[offset:offset + length]
+                prefixes[key] = (sums[prefix_offset:prefix_offset + length + 1],
+                                 counts[prefix_offset:prefix_offset + length + 1])
+                offset += length
+                prefix_offset += length + 1
+            self._postings[name] = table
+            self._posting_rt[name] = prefixes
+
+
+def _rt_prefix(values):
+    """
+    response_time_ms 前缀和与有效值（非 NaN）前缀计数
+
+    返回:
+        tuple: (array("d"), array("I"))，长度均为 len(values) + 1，
+               区间 [i, j) 的和为 sums[j] - sums[i]
+    """
+    sums = array("d", [0.0])
+    counts = array("I", [0])
+    total = 0.0
+    valid = 0
+    for value in values:
+        if value == value:
+            total += value
+            valid += 1
+        sums.append(total)
+        counts.append(valid)
+    return sums, counts
+
+
+# ============================================
+# 查询条件
+# ============================================
+
+class Query:
+    """
+    过滤条件
+
+    参数:
+        since / until: 毫秒时间戳区间 [since, until)
+        paths: 限定的 url_path 集合
+        status_min / status_max: 状态码闭区间
+        min_response_time: response_time_ms 下限（含）
+        severities: 限定的 severity 集合
+        methods: 限定的 http_method 集合
+    """
+
+    def __init__(self, since=None, until=None, paths=None, status_min=None,
+                 status_max=None, min_response_time=None, severities=None,
+                 methods=None):
+        self.since = since
+        self.until = until
+        self.paths = set(paths) if paths else None
+        self.status_min = status_min
+        self.status_max = status_max
+        self.min_response_time = min_response_time
+        self.severities = set(severities) if severities else None
+        self.methods = set(methods) if methods else None
+
+        # 派生条件：状态码闭区间、severity 下标集合
+        self.status_range = None
+        if status_min is not None or status_max is not None:
+            self.status_range = (status_min if status_min is not None else 0,
+                                 status_max if status_max is not None else 65535)
+        self.severity_codes = None
+        if self.severities is not None:
+            self.severity_codes = {SEVERITIES.index(s) for s in self.severities}
+
+    def only_time(self):
+        """是否只有时间条件"""
+        return (self.paths is None and self.status_range is None and self.severities is None
+                and self.methods is None and self.min_response_time is None)
+
+
+# ============================================
+# 日志存储
+# ============================================
+
+class LogStore:
+    """
+    列式日志存储
+
+    可以纯内存使用，也可以通过 save/open 持久化到目录
+    （每个段一个子目录，目录名为分区起始时间戳）。
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.segments = {}
+
+    @classmethod
+    def open(cls, directory):
+        """打开已有存储目录（不存在时返回空存储），只读取各段的 meta.json"""
+        store = cls(directory)
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isfile(os.path.join(path, "meta.json")):
+                    segment = Segment.load(path)
+                    store.segments[segment.start] = segment
+        return store
+
+    def add(self, event):
+        """写入单条事件"""
+        start = event["ts"] // 1000 // SEGMENT_SPAN * SEGMENT_SPAN
+        segment = self.segments.get(start)
+        if segment is None:
+            segment = self.segments[start] = Segment(start)
+        segment.append(event)
+
+    def ingest(self, events):
+        """
+        批量写入事件并封存所有被修改的段
+
+        返回:
+            int: 写入的事件数
+        """
+        count = 0
+        for event in events:
+            self.add(event)
+            count += 1
+        self.seal()
+        return count
+
+    def seal(self):
+        for segment in self.segments.values():
+            if not segment.sealed:
+                segment.seal()
+
+    def save(self, directory=None):
+        """写出新建或被修改过的段（未改动的段不重写）"""
+        directory = directory or self.directory
+        for start, segment in self.segments.items():
+            if not segment.saved:
+                segment.save(os.path.join(directory, str(start)))
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments.values())
+
+    @property
+    def max_ts(self):
+        values = [s.max_ts for s in self.segments.values() if s.max_ts is not None]
+        return max(values) if values else None
+
+    # ---------- 查询执行 ----------
+
+    def _candidate_segments(self, query):
+        """按区间统计（meta.json 中的 zone）筛选段，未被选中的段不会读取列数据"""
+        for start in sorted(self.segments):
+            segment = self.segments[start]
+            if not len(segment):
+                continue
+            if query.since is not None and segment.max_ts < query.since:
+                continue
+            if query.until is not None and segment.min_ts >= query.until:
+                continue
+            if query.min_response_time is not None and \
+                    not segment.max_rt >= query.min_response_time:
+                continue
+            yield segment
+
+    def _selection(self, segment, query):
+        """
+        按时间二分与倒排表选出候选行
+
+        倒排表使用 path / status / severity 中第一个有条件的列，
+        在时间区间 [lo, hi) 内二分截取各个键的行号切片。
+
+        返回:
+            tuple: (selector, parts, residual)
+                selector: 选行使用的倒排列，None 表示只按时间
+                parts: [(键, 行号序列, 前缀, 起始下标)]，行号升序；
+                       前缀为 (前缀和, 有效值前缀计数)，序列第 i 行对应前缀下标 起始下标 + i
+                residual: 是否还有需要逐行检查的条件
+        """
+        lo, hi = segment.row_range(query.since, query.until)
+        if lo >= hi:
+            return None, [], False
+
+        selector = None
+        if query.paths is not None:
+            selector = "path"
+            keys = [segment._codes["path"].get(p) for p in query.paths]
+        elif query.status_range is not None:
+            selector = "status"
+            s_lo, s_hi = query.status_range
+            keys = [k for k in segment.postings["status"] if s_lo <= k <= s_hi]
+        elif query.severity_codes is not None:
+            selector = "severity"
+            keys = query.severity_codes
+
+        residual = not query.only_time()
+        if selector is None:
+            return None, [(None, range(lo, hi), segment.rt_prefix, lo)], residual
+
+        # 选行列的条件已由倒排表精确满足，其余条件仍需逐行检查
+        residual = (
+            (query.status_range is not None and selector != "status")
+            or (query.severity_codes is not None and selector != "severity")
+            or query.methods is not None or query.min_response_time is not None
+        )
+        table = segment.postings[selector]
+        prefixes = segment.posting_rt[selector]
+        parts = []
+        for key in keys:
+            posting = table.get(key)
+            if posting:
+                a = bisect_left(posting, lo)
+                b = bisect_left(posting, hi)
+                if a < b:
+                    parts.append((key, posting[a:b], prefixes[key], a))
+        return selector, parts, residual
+
+    def _filter_rows(self, segment, query, selector, rows):
+        """逐行检查选行列以外的条件"""
+        cols = segment.columns
+        if query.status_range is not None and selector != "status":
+            status, (s_lo, s_hi) = cols["status"], query.status_range
+            rows = [row for row in rows if s_lo <= status[row] <= s_hi]
+        if query.severity_codes is not None and selector != "severity":
+            severity, wanted = cols["severity"], query.severity_codes
+            rows = [row for row in rows if severity[row] in wanted]
+        if query.methods is not None:
+            wanted = {segment._codes["method"][m] for m in query.methods
+                      if m in segment._codes["method"]}
+            method = cols["method"]
+            rows = [row for row in rows if method[row] in wanted]
+        if query.min_response_time is not None:
+            threshold = query.min_response_time
+            rt = cols["rt"]
+            rows = [row for row in rows if rt[row] >= threshold]
+        return rows
+
+    def _matching_rows(self, segment, query):
+        """计算段内命中的行号（升序）"""
+        selector, parts, residual = self._selection(segment, query)
+        if not parts:
+            return []
+        if len(parts) == 1:
+            rows = parts[0][1]
+        else:
+            rows = sorted(row for part in parts for row in part[1])
+        if residual:
+            rows = self._filter_rows(segment, query, selector, rows)
+        return rows
+
+    def scan(self, query):
+        """
+        遍历命中结果
+
+        返回:
+            generator: (segment, 行号列表)
+        """
+        for segment in self._candidate_segments(query):
+            rows = self._matching_rows(segment, query)
+            if rows:
+                yield segment, rows
+
+    # ---------- 聚合 ----------
+    # 没有需要逐行检查的条件时，计数与 response_time_ms 之和直接由
+    # 倒排表切片长度 / 前缀和之差得到，数值列按行区间整段切片；否则回退为逐行计算
+
+    def count(self, query):
+        total = 0
+        for segment in self._candidate_segments(query):
+            selector, parts, residual = self._selection(segment, query)
+            if residual:
+                total += len(self._matching_rows(segment, query))
+            else:
+                total += sum(len(part[1]) for part in parts)
+        return total
+
+    def values(self, query, field="rt"):
+        """返回命中行的数值列（response_time_ms 忽略缺失值）"""
+        out = []
+        for segment in self._candidate_segments(query):
+            column = segment.columns[field]
+            selector, parts, residual = self._selection(segment, query)
+            if selector is None and parts and not residual:
+                # 只有时间条件：整段切片（C 层复制），没有缺失值时无需逐个检查
+                _, rows, (_, counts), base = parts[0]
+                chunk = column[rows.start:rows.stop]
+                if field == "rt" and counts[base + len(rows)] - counts[base] != len(rows):
+                    chunk = [v for v in chunk if v == v]
+                out.extend(chunk)
+                continue
+            rows = self._matching_rows(segment, query)
+            if field == "rt":
+                out.extend(v for v in (column[row] for row in rows) if v == v)
+            else:
+                out.extend(column[row] for row in rows)
+        return out
+
+    def stats(self, query):
+        """
+        response_time_ms 统计
+
+        返回:
+            dict: count / min / max / avg（无数据时后三者为 None）
+        """
+        values = self.values(query)
+        if not values:
+            return {"count": 0, "min": None, "max": None, "avg": None}
+        return {
+            "count": len(values),
+            "min": min(values),
+            "max": max(values),
+            "avg": sum(values) / len(values),
+        }
+
+    def percentiles(self, query, percents=(50, 95, 99)):
+        """
+        response_time_ms 精确分位数（线性插值）
+
+        返回:
+            dict: 分位 -> 数值（无数据时为 None）
+        """
+        values = self.values(query)
+        values.sort()
+        result = {}
+        for p in percents:
+            if not values:
+                result[p] = None
+                continue
+            rank = (len(values) - 1) * p / 100.0
+            lo = int(rank)
+            hi = min(lo + 1, len(values) - 1)
+            result[p] = values[lo] + (values[hi] - values[lo]) * (rank - lo)
+        return result
+
+    def terms(self, query, field="path", size=10, order="count"):
+        """
+        terms 聚合
+
+        参数:
+            field: path / method / status / severity
+            size: 返回的桶数量
+            order: count 按文档数降序，avg_response_time 按平均响应时间降序
+
+        返回:
+            list[dict]: 每个桶含 key / doc_count / avg_response_time
+        """
+        counts = Counter()
+        rt_sums = defaultdict(float)
+        rt_counts = Counter()
+        for segment in self._candidate_segments(query):
+            if field in DICT_COLUMNS:
+                decode = segment.dicts[field].__getitem__
+            elif field == "severity":
+                decode = SEVERITIES.__getitem__
+            else:
+                decode = None
+
+            selector, parts, residual = self._selection(segment, query)
+            if not residual and field in POSTING_COLUMNS and selector in (None, field):
+                # 每个键的桶直接来自该键倒排表在 [lo, hi) 内的切片
+                if selector is None and parts:
+                    _, rows, _, _ = parts[0]
+                    lo, hi = rows.start, rows.stop
+                    parts = []
+                    prefixes = segment.posting_rt[field]
+                    for key, posting in segment.postings[field].items():
+                        a = bisect_left(posting, lo)
+                        b = bisect_left(posting, hi)
+                        if a < b:
+                            parts.append((key, posting[a:b], prefixes[key], a))
+                for key, rows, (sums, valid), base in parts:
+                    end = base + len(rows)
+                    name = decode(key) if decode else key
+                    counts[name] += len(rows)
+                    rt_sums[name] += sums[end] - sums[base]
+                    rt_counts[name] += valid[end] - valid[base]
+                continue
+
+            rows = self._matching_rows(segment, query)
+            column = segment.columns[field]
+            rt = segment.columns["rt"]
+            local = Counter(column[row] for row in rows)
+            for code, n in local.items():
+                counts[decode(code) if decode else code] += n
+            for row in rows:
+                value = rt[row]
+                if value == value:
+                    key = decode(column[row]) if decode else column[row]
+                    rt_sums[key] += value
+                    rt_counts[key] += 1
+
+        buckets = [
+            {
+                "key": key,
+                "doc_count": n,
+                "avg_response_time": rt_sums[key] / rt_counts[key] if rt_counts[key] else None,
+            }
+            for key, n in counts.items()
+        ]
+        if order == "avg_response_time":
+            buckets.sort(key=lambda b: (b["avg_response_time"] or 0, b["doc_count"]), reverse=True)
+        else:
+            buckets.sort(key=lambda b: b["doc_count"], reverse=True)
+        return buckets[:size]
+
+    def date_histogram(self, query, interval_ms):
+        """
+        日期直方图
+
+        没有逐行条件时，在 ts 列上二分每个桶的边界，桶内计数与响应时间之和由
+        候选行切片中的位置与前缀和之差得到；桶数多于候选行时回退为逐行计算
+
+        返回:
+            list[dict]: 每个桶含 key（毫秒时间戳）/ doc_count / avg_response_time
+        """
+        counts = Counter()
+        rt_sums = defaultdict(float)
+        rt_counts = Counter()
+        for segment in self._candidate_segments(query):
+            ts = segment.columns["ts"]
+            selector, parts, residual = self._selection(segment, query)
+            if not parts:
+                continue
+            first = min(ts[part[1][0]] for part in parts) // interval_ms * interval_ms
+            last = max(ts[part[1][-1]] for part in parts)
+            n_buckets = (last - first) // interval_ms + 1
+            if not residual and n_buckets <= sum(len(part[1]) for part in parts):
+                boundaries = [bisect_left(ts, first + i * interval_ms) for i in range(n_buckets + 1)]
+                for _, rows, (sums, valid), base in parts:
+                    if isinstance(rows, range):
+                        positions = [min(max(b, rows.start), rows.stop) - rows.start for b in boundaries]
+                    else:
+                        positions = [bisect_left(rows, b) for b in boundaries]
+                    for i in range(n_buckets):
+                        a, b = positions[i], positions[i + 1]
+                        if a < b:
+                            key = first + i * interval_ms
+                            counts[key] += b - a
+                            rt_sums[key] += sums[base + b] - sums[base + a]
+                            rt_counts[key] += valid[base + b] - valid[base + a]
+                continue
+
+            rt = segment.columns["rt"]
+            for row in self._matching_rows(segment, query):
+                key = ts[row] // interval_ms * interval_ms
+                counts[key] += 1
+                value = rt[row]
+                if value == value:
+                    rt_sums[key] += value
+                    rt_counts[key] += 1
+        return [
+            {
+                "key": key,
+                "doc_count": counts[key],
+                "avg_response_time": rt_sums[key] / rt_counts[key] if rt_counts[key] else None,
+            }
+            for key in sorted(counts)
+        ]
+
+    # ---------- 告警条件（对应 Watcher） ----------
+
+    def slow_requests(self, now_ms, window=WATCH_WINDOW):
+        """
+        慢请求检查，等价于 slow-request-watcher
+
+        返回:
+            dict: slow_request_count / avg_response_time / max_response_time /
+                  slow_endpoints / triggered
+        """
+        query = Query(since=now_ms - window * 1000, until=now_ms + 1,
+                      min_response_time=SLOW_REQUEST_THRESHOLD_MS)
+        stats = self.stats(query)
+        return {
+            "slow_request_count": stats["count"],
+            "avg_response_time": stats["avg"],
+            "max_response_time": stats["max"],
+            "slow_endpoints": self.terms(query, "path", order="avg_response_time"),
+            "triggered": stats["count"] > SLOW_REQUEST_COUNT_THRESHOLD,
+        }
+
+    def error_rate(self, now_ms, window=WATCH_WINDOW):
+        """
+        错误率检查，等价于 error-rate-watcher
+
+        返回:
+            dict: error_count / errors_by_type / errors_by_endpoint / triggered
+        """
+        query = Query(since=now_ms - window * 1000, until=now_ms + 1,
+                      severities=("ERROR", "WARNING"))
+        count = self.count(query)
+        return {
+            "error_count": count,
+            "errors_by_type": self.terms(query, "severity"),
+            "errors_by_endpoint": self.terms(query, "path"),
+            "triggered": count > ERROR_COUNT_THRESHOLD,
+        }
+
+
+# ============================================
+# 命令行
+# ============================================
+
+def parse_duration(value):
+    """
+    解析时长，如 500ms / 30s / 5m / 1h / 7d
+
+    返回:
+        float: 秒
+    """
+    for unit in sorted(TIME_UNITS, key=len, reverse=True):
+        if value.endswith(unit):
+            return float(value[:-len(unit)]) * TIME_UNITS[unit]
+    return float(value)
+
+
+def resolve_now(store, value):
+    """解析 --now 参数: latest 表示存储中最新事件时间，否则为 ISO8601 时间或当前时间"""
+    if value == "latest":
+        return store.max_ts or int(time.time() * 1000)
+    if value:
+        return parse_timestamp(value)
+    return int(time.time() * 1000)
+
+
+def build_query(args, store):
+    now_ms = resolve_now(store, args.now)
+    since = now_ms - int(parse_duration(args.last) * 1000) if args.last else None
+    status_min = status_max = None
+    if args.status:
+        if args.status.endswith("xx"):
+            status_min = int(args.status[0]) * 100
+            status_max = status_min + 99
+        else:
+            status_min = status_max = int(args.status)
+    return Query(
+        since=since,
+        until=now_ms + 1,
+        paths=args.path,
+        status_min=status_min,
+        status_max=status_max,
+        min_response_time=args.min_response_time,
+        severities=args.severity,
+        methods=args.method,
+    )
+
+
+def format_ms(value):
+    return "-" if value is None else f"{value:.2f} ms"
+
+
+def format_ts(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def cmd_ingest(args):
+    store = LogStore.open(args.store)
+    started = time.perf_counter()
+    count = store.ingest(iter_events(args.files))
+    store.save()
+    elapsed = time.perf_counter() - started
+    print(f"导入 {count} 条事件，用时 {elapsed:.2f}s，"
+          f"存储共 {len(store)} 条 / {len(store.segments)} 个段")
+
+
+def cmd_percentiles(args, store):
+    query = build_query(args, store)
+    percents = [float(p) for p in args.percents.split(",")]
+    result = store.percentiles(query, percents)
+    for p in percents:
+        print(f"P{p:g}: {format_ms(result[p])}")
+
+
+def cmd_stats(args, store):
+    stats = store.stats(build_query(args, store))
+    print(f"count: {stats['count']}")
+    print(f"min:   {format_ms(stats['min'])}")
+    print(f"max:   {format_ms(stats['max'])}")
+    print(f"avg:   {format_ms(stats['avg'])}")
+
+
+def cmd_terms(args, store):
+    field = {"url_path": "path", "http_method": "method",
+             "status_code": "status"}.get(args.field, args.field)
+    for bucket in store.terms(build_query(args, store), field, args.size):
+        print(f"{bucket['doc_count']:>10}  {format_ms(bucket['avg_response_time']):>12}  {bucket['key']}")
+
+
+def cmd_top_slow(args, store):
+    buckets = store.terms(build_query(args, store), "path", args.size,
+                          order="avg_response_time")
+    for bucket in buckets:
+        print(f"{format_ms(bucket['avg_response_time']):>12}  {bucket['doc_count']:>10}  {bucket['key']}")
+
+
+def cmd_histogram(args, store):
+    interval_ms = int(parse_duration(args.interval) * 1000)
+    for bucket in store.date_histogram(build_query(args, store), interval_ms):
+        print(f"{format_ts(bucket['key'])}  {bucket['doc_count']:>10}  "
+              f"{format_ms(bucket['avg_response_time']):>12}")
+
+
+def cmd_slow_requests(args, store):
+    result = store.slow_requests(resolve_now(store, args.now))
+    print(f"慢请求（>={SLOW_REQUEST_THRESHOLD_MS}ms）: {result['slow_request_count']}，"
+          f"平均 {format_ms(result['avg_response_time'])}，最大 {format_ms(result['max_response_time'])}")
+    for bucket in result["slow_endpoints"]:
+        print(f"  {format_ms(bucket['avg_response_time']):>12}  {bucket['doc_count']:>6}  {bucket['key']}")
+    if result["triggered"]:
+        print(f"告警: 在过去5分钟内检测到 {result['slow_request_count']} 个慢请求（>1s）")
+        return 1
+    return 0
+
+
+def cmd_error_rate(args, store):
+    result = store.error_rate(resolve_now(store, args.now))
+    print(f"错误/警告日志: {result['error_count']}")
+    for bucket in result["errors_by_type"]:
+        print(f"  {bucket['doc_count']:>6}  {bucket['key']}")
+    for bucket in result["errors_by_endpoint"]:
+        print(f"  {bucket['doc_count']:>6}  {bucket['key']}")
+    if result["triggered"]:
+        print(f"告警: 在过去5分钟内检测到 {result['error_count']} 个错误/警告日志")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地日志分析查询引擎")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="导入日志文件")
+    ingest.add_argument("--store", required=True, help="存储目录")
+    ingest.add_argument("files", nargs="+", help="日志文件，- 表示标准输入")
+
+    def add_query_args(p, filters=True):
+        p.add_argument("--store", required=True, help="存储目录")
+        p.add_argument("--now", default=None, help="参考时间（ISO8601 或 latest），默认当前时间")
+        if not filters:
+            return
+        p.add_argument("--last", default=None, help="时间窗口，如 5m / 1h / 1d")
+        p.add_argument("--path", action="append", help="url_path，可重复")
+        p.add_argument("--status", default=None, help="状态码，如 500 或 5xx")
+        p.add_argument("--method", action="append", help="HTTP 方法，可重复")
+        p.add_argument("--severity", action="append", choices=SEVERITIES)
+        p.add_argument("--min-response-time", type=float, default=None,
+                       help="response_time_ms 下限")
+
+    commands = {}
+    for name, func, help_text in (
+        ("percentiles", cmd_percentiles, "响应时间分位数"),
+        ("stats", cmd_stats, "响应时间统计"),
+        ("terms", cmd_terms, "按字段分组计数"),
+        ("top-slow", cmd_top_slow, "平均响应时间最高的接口"),
+        ("histogram", cmd_histogram, "日期直方图"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        add_query_args(p)
+        commands[name] = func
+    sub.choices["percentiles"].add_argument("--percents", default="50,95,99")
+    sub.choices["terms"].add_argument("--field", default="url_path",
+                                      choices=["url_path", "status_code", "http_method", "severity"])
+    for name in ("terms", "top-slow"):
+        sub.choices[name].add_argument("--size", type=int, default=10)
+    sub.choices["histogram"].add_argument("--interval", default="1m")
+
+    for name, func, help_text in (
+        ("slow-requests", cmd_slow_requests, "慢请求告警检查（slow-request-watcher）"),
+        ("error-rate", cmd_error_rate, "错误率告警检查（error-rate-watcher）"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        add_query_args(p, filters=False)
+        commands[name] = func
+
+    args = parser.parse_args(argv)
+    if args.command == "ingest":
+        cmd_ingest(args)
+        return 0
+
+    # 用时包含打开存储（读取列、字典与倒排表）
+    started = time.perf_counter()
+    store = LogStore.open(args.store)
+    loaded = time.perf_counter()
+    code = commands[args.command](args, store) or 0
+    finished = time.perf_counter()
+    print(f"（查询用时 {(finished - started) * 1000:.1f} ms，其中加载 {(loaded - started) * 1000:.1f} ms）",
+          file=sys.stderr)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+"""
+共享内存日志环形缓冲区 - Gunicorn worker 与日志转发进程之间的无锁 SPSC 队列
+
+功能:
+1. master 在 fork worker 之前为每个 worker 槽位分配一块匿名共享内存（mmap），
+   worker 重启后复用同一槽位继续写入
+2. worker 中的 RingBufferHandler 将格式化好的日志行写入本进程的环形缓冲区，
+   缓冲区满时丢弃并计数，不阻塞请求
+3. 由 master 启动的单个转发进程（shipper）轮询所有缓冲区，批量写到 stdout 或文件，
+   多个 worker 的输出不再争用同一管道，长日志行（如异常堆栈）不会交错；
+   master 中的监控线程发现转发进程退出后输出错误并重新启动
+4. 暴露占用率、历史最高占用和丢弃计数，供 /readyz 与定期指标日志使用
+5. 开启 ALERT_EVALUATOR_ENABLED 时由转发进程运行唯一的流式告警评估器，
+   统计所有 worker 的日志（各 worker 不再各自维护窗口）
+
+每个缓冲区只有一个生产者（worker，进程内多线程由锁串行化）和一个消费者（shipper），
+生产者只写 head、消费者只写 tail，两个进程之间无需加锁。
+
+内存顺序：Python 无法发出内存屏障，mmap 读写就是普通的 load/store。
+x86-64（TSO）上 store 之间、load 之间不会重排，"先写内容再发布 head" 即等价于
+release/acquire；ARM 等弱序 CPU 上消费者可能先看到新 head、后看到内容，
+因此每条记录带 CRC32，消费者校验失败时不前移 tail、下次轮询重试
+（连续 RING_STALL_LIMIT 次仍失败才视为损坏并丢弃），不依赖 CPU 的写入顺序。
+
+Gunicorn 平滑重启（HUP）时新 worker 先于旧 worker 退出启动，
+因此按 worker 数的 LOG_RING_SLOTS_PER_WORKER 倍分配槽位，新旧 worker 同时存活时也有空闲槽位。
+
+自检（小容量缓冲区上的跨末尾回绕、缓冲区满丢弃、第二个生产者复用槽位）:
+    python log_ring.py --self-check
+
+通过环境变量开启（默认关闭，仅在 Gunicorn 下生效）:
+    LOG_RING_ENABLED=true
+    LOG_RING_SIZE=1048576                每个 worker 缓冲区字节数
+    LOG_SHIPPER_OUTPUT=-                 转发目标，- 为 stdout，否则为文件路径
+    LOG_SHIPPER_INTERVAL_MS=5            缓冲区为空时的轮询间隔
+    LOG_SHIPPER_METRICS_INTERVAL=60      缓冲区指标日志间隔（秒），0 表示不输出
+"""
+
+import json
+import logging
+import mmap
+import os
+import signal
+import struct
+import threading
+import time
+import traceback
+import zlib
+from datetime import datetime
+
+# ============================================
+# 配置参数
+# ============================================
+
+LOG_RING_ENABLED = os.environ.get("LOG_RING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# 每个 worker 的缓冲区大小（字节）
+LOG_RING_SIZE = int(os.environ.get("LOG_RING_SIZE", str(1024 * 1024)))
+
+# 转发目标
+LOG_SHIPPER_OUTPUT = os.environ.get("LOG_SHIPPER_OUTPUT", "-")
+
+# 所有缓冲区为空时的轮询间隔（毫秒）
+LOG_SHIPPER_INTERVAL_MS = float(os.environ.get("LOG_SHIPPER_INTERVAL_MS", "5"))
+
+# 缓冲区指标日志间隔（秒）
+LOG_SHIPPER_METRICS_INTERVAL = float(os.environ.get("LOG_SHIPPER_METRICS_INTERVAL", "60"))
+
+# 在转发进程中运行流式告警评估（见 alert_evaluator.py）
+ALERT_EVALUATOR_ENABLED = os.environ.get("ALERT_EVALUATOR_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# 告警评估器无新日志时推进时间的间隔（秒）
+ALERT_TICK_INTERVAL = 1.0
+
+# master 中检查转发进程是否存活的间隔（秒），退出后由监控线程重新启动
+SHIPPER_CHECK_INTERVAL = 1.0
+
+# 每个 worker 预留的槽位数（平滑重启期间新旧 worker 同时存活）
+LOG_RING_SLOTS_PER_WORKER = 2
+
+# 记录校验连续失败的轮询次数上限，超过后视为损坏并丢弃已发布内容
+RING_STALL_LIMIT = 200
+
+# 单次写出的最大字节数
+LOG_SHIPPER_BATCH_BYTES = 256 * 1024
+
+# 缓冲区头部布局：生产者字段与消费者字段分处不同缓存行，避免伪共享
+HEAD_OFFSET = 0             # 生产者：已写入的累计字节位置
+WRITTEN_OFFSET = 8          # 生产者：已写入记录数
+DROPPED_OFFSET = 16         # 生产者：因缓冲区满丢弃的记录数
+DROPPED_BYTES_OFFSET = 24   # 生产者：丢弃的字节数
+HIGH_WATER_OFFSET = 32      # 生产者：历史最高占用字节数
+TAIL_OFFSET = 64            # 消费者：已读取的累计字节位置
+DISCARDED_OFFSET = 72       # 消费者：校验失败丢弃的字节数
+HEADER_SIZE = 128
+
+U64 = struct.Struct("<Q")
+RECORD_HEADER = struct.Struct("<II")  # 内容长度, CRC32
+
+
+# ============================================
+# 环形缓冲区
+# ============================================
+
+class LogRing:
+    """
+    单生产者单消费者的字节环形缓冲区
+
+    head / tail 为单调递增的累计字节位置，实际偏移为 位置 % capacity；
+    每条记录为 4 字节长度 + 4 字节 CRC32 + 内容，跨越末尾时分两段复制。
+    生产者先写入记录内容，再发布 head；消费者校验并读完记录后再发布 tail。
+    """
+
+    def __init__(self, size=LOG_RING_SIZE):
+        self.capacity = size
+        # 匿名共享映射：fork 出的 worker 与 shipper 访问同一块物理内存
+        self.buf = mmap.mmap(-1, HEADER_SIZE + size)
+        self._lock = threading.Lock()
+        self._producer = None
+        self._stalled = {"tail": None, "polls": 0}
+
+    def _load(self, offset):
+        # 另一进程可能正在更新该字段，连续两次读到相同的值才采用，避免读到写了一半的值；
+        # 这只防止撕裂读，不提供任何内存顺序保证（见模块说明中的 CRC 校验）
+        value = U64.unpack_from(self.buf, offset)[0]
+        while True:
+            again = U64.unpack_from(self.buf, offset)[0]
+            if again == value:
+                return value
+            value = again
+
+    def _store(self, offset, value):
+        U64.pack_into(self.buf, offset, value)
+
+    def _copy_in(self, position, data):
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.buf[HEADER_SIZE + start:HEADER_SIZE + start + first] = data[:first]
+        if first < len(data):
+            self.buf[HEADER_SIZE:HEADER_SIZE + len(data) - first] = data[first:]
+
+    def _copy_out(self, position, size):
+        start = position % self.capacity
+        first = min(size, self.capacity - start)
+        data = self.buf[HEADER_SIZE + start:HEADER_SIZE + start + first]
+        if first < size:
+            data += self.buf[HEADER_SIZE:HEADER_SIZE + size - first]
+        return data
+
+    # ---------- 生产者（worker） ----------
+
+    def write(self, data):
+        """
+        写入一条记录
+
+        参数:
+            data: bytes
+
+        返回:
+            bool: 缓冲区空间不足、记录被丢弃时返回 False
+        """
+        need = RECORD_HEADER.size + len(data)
+        with self._lock:
+            state = self._producer
+            if state is None:
+                # 首次写入（或 worker 重启后复用槽位）时从共享内存恢复生产者计数
+                state = self._producer = {
+                    "head": self._load(HEAD_OFFSET),
+                    "written": self._load(WRITTEN_OFFSET),
+                    "dropped": self._load(DROPPED_OFFSET),
+                    "dropped_bytes": self._load(DROPPED_BYTES_OFFSET),
+                    "high_water": self._load(HIGH_WATER_OFFSET),
+                }
+            head = state["head"]
+            used = head - self._load(TAIL_OFFSET)
+            if need > self.capacity - used:
+                state["dropped"] += 1
+                state["dropped_bytes"] += len(data)
+                self._store(DROPPED_OFFSET, state["dropped"])
+                self._store(DROPPED_BYTES_OFFSET, state["dropped_bytes"])
+                return False
+
+            self._copy_in(head, RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data)
+            state["head"] = head + need
+            state["written"] += 1
+            self._store(HEAD_OFFSET, state["head"])
+            self._store(WRITTEN_OFFSET, state["written"])
+            if used + need > state["high_water"]:
+                state["high_water"] = used + need
+                self._store(HIGH_WATER_OFFSET, state["high_water"])
+            return True
+
+    # ---------- 消费者（shipper） ----------
+
+    def drain(self, limit=LOG_SHIPPER_BATCH_BYTES):
+        """
+        读取已发布的记录
+
+        长度或 CRC 校验不通过时（弱序 CPU 上内容尚未可见）停在该记录，下次重试；
+        同一位置连续 RING_STALL_LIMIT 次失败则丢弃已发布的全部内容以恢复。
+
+        参数:
+            limit: 本次最多读取的字节数（至少读取一条）
+
+        返回:
+            list[bytes]: 记录内容
+        """
+        head = self._load(HEAD_OFFSET)
+        tail = self._load(TAIL_OFFSET)
+        records = []
+        size = 0
+        while tail < head and size < limit:
+            length, crc = RECORD_HEADER.unpack(self._copy_out(tail, RECORD_HEADER.size))
+            data = None
+            if length <= head - tail - RECORD_HEADER.size:
+                data = self._copy_out(tail + RECORD_HEADER.size, length)
+                if zlib.crc32(data) != crc:
+                    data = None
+            if data is None:
+                stalled = self._stalled
+                if stalled["tail"] == tail:
+                    stalled["polls"] += 1
+                else:
+                    stalled["tail"], stalled["polls"] = tail, 1
+                if stalled["polls"] >= RING_STALL_LIMIT:
+                    self._store(DISCARDED_OFFSET, self._load(DISCARDED_OFFSET) + head - tail)
+                    tail = head
+                break
+            records.append(data)
+            tail += RECORD_HEADER.size + length
+            size += length
+        self._store(TAIL_OFFSET, tail)
+        return records
+
+    # ---------- 指标 ----------
+
+    def stats(self):
+        """
+        返回:
+            dict: 容量、当前占用、历史最高占用、写入/丢弃计数
+        """
+        used = self._load(HEAD_OFFSET) - self._load(TAIL_OFFSET)
+        high_water = self._load(HIGH_WATER_OFFSET)
+        return {
+            "capacity_bytes": self.capacity,
+            "used_bytes": used,
+            "occupancy_pct": round(used * 100.0 / self.capacity, 2),
+            "high_water_pct": round(high_water * 100.0 / self.capacity, 2),
+            "written": self._load(WRITTEN_OFFSET),
+            "dropped": self._load(DROPPED_OFFSET),
+            "dropped_bytes": self._load(DROPPED_BYTES_OFFSET),
+            "discarded_bytes": self._load(DISCARDED_OFFSET),
+        }
+
+
+class RingBufferHandler(logging.Handler):
+    """将格式化后的日志行（含换行）写入环形缓冲区"""
+
+    def __init__(self, ring):
+        super().__init__()
+        self.ring = ring
+
+    def emit(self, record):
+        try:
+            self.ring.write((self.format(record) + "\n").encode("utf-8"))
+        except Exception:
+            self.handleError(record)
+
+
+# ============================================
+# 槽位分配（master 中调用，fork 前完成）
+# ============================================
+
+_rings = []
+_attached = {"ring": None, "slot": None}
+_shipper = {"pid": None, "shared_pid": None, "watchdog": None, "stopping": threading.Event()}
+
+
+def allocate(count, size=LOG_RING_SIZE):
+    """
+    分配 count 个槽位的缓冲区（已分配时只补足数量）
+
+    转发进程 fork 时继承的是当时的 _rings，之后新增的槽位它看不到，
+    因此须在启动转发进程前按 worker 数 × LOG_RING_SLOTS_PER_WORKER 一次分配
+    """
+    while len(_rings) < count:
+        _rings.append(LogRing(size))
+    return _rings
+
+
+def free_slot(used):
+    """
+    选择未被存活 worker 占用的槽位
+
+    参数:
+        used: 存活 worker 已占用的槽位集合
+
+    返回:
+        int | None: 槽位编号；没有空闲槽位时返回 None（该 worker 直接写 stdout）
+    """
+    for slot in range(len(_rings)):
+        if slot not in used:
+            return slot
+    return None
+
+
+def attach(slot):
+    """worker 中调用：绑定本进程使用的缓冲区"""
+    if slot is None or slot >= len(_rings):
+        return None
+    _attached["ring"], _attached["slot"] = _rings[slot], slot
+    return _rings[slot]
+
+
+def current():
+    """本进程绑定的缓冲区（未启用或未绑定时为 None）"""
+    return _attached["ring"]
+
+
+def ring_metrics():
+    """本进程缓冲区的指标，供 /readyz 输出"""
+    ring = _attached["ring"]
+    if ring is None:
+        return None
+    return dict(ring.stats(), slot=_attached["slot"])
+
+
+def shipper_alive():
+    """转发进程是否存活（worker 中从共享内存读取进程号，转发进程重启后同样适用）"""
+    shared = _shipper["shared_pid"]
+    pid = struct.unpack_from("<q", shared, 0)[0] if shared is not None else _shipper["pid"]
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+# ============================================
+# 转发进程
+# ============================================
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _metrics_line(rings, shipped):
+    record = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "level": "INFO",
+        "logger": "log_shipper",
+        "message": "Log ring metrics",
+        "log_ring": {
+            "shipped_records": shipped["records"],
+            "shipped_bytes": shipped["bytes"],
+            "batches": shipped["batches"],
+            "rings": [dict(ring.stats(), slot=slot) for slot, ring in enumerate(rings)],
+        },
+    }
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class _AlertLineHandler(logging.Handler):
+    """转发进程内将告警日志（elk_alerts）格式化为 JSON 行，随下一批日志写出"""
+
+    def __init__(self, lines):
+        super().__init__()
+        self.lines = lines
+
+    def emit(self, record):
+        line = {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        self.lines.append((json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+def _alert_evaluator(lines):
+    """创建转发进程内的告警评估器，告警日志追加到 lines"""
+    from alert_evaluator import AlertEvaluator, alert_logger
+
+    alert_logger.setLevel(logging.INFO)
+    alert_logger.propagate = False
+    alert_logger.addHandler(_AlertLineHandler(lines))
+    return AlertEvaluator.from_watchers()
+
+
+def _evaluate(evaluator, batch):
+    """将一批日志行送入评估器（非 JSON 行，如 Gunicorn 访问日志，由 parse_line 跳过）"""
+    from log_query import parse_line
+
+    for record in batch:
+        event = parse_line(record)
+        if event is not None:
+            evaluator.process(event)
+
+
+def run_shipper(rings, output=LOG_SHIPPER_OUTPUT, parent_pid=None, alerts=ALERT_EVALUATOR_ENABLED):
+    """
+    转发循环：依次清空各缓冲区并批量写出；收到 SIGTERM 或父进程退出后做最后一次清空并返回
+
+    参数:
+        rings: LogRing 列表
+        output: "-" 表示 stdout，否则为追加写入的文件路径
+        parent_pid: master 进程号，父进程变化时退出
+        alerts: 是否对转发的日志运行流式告警评估（整个主机一个窗口）
+    """
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    fd = 1 if output == "-" else os.open(output, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    interval = LOG_SHIPPER_INTERVAL_MS / 1000.0
+    shipped = {"records": 0, "bytes": 0, "batches": 0}
+    next_metrics = time.monotonic() + LOG_SHIPPER_METRICS_INTERVAL
+    alert_lines = []
+    evaluator = _alert_evaluator(alert_lines) if alerts else None
+    next_tick = time.monotonic() + ALERT_TICK_INTERVAL
+
+    while True:
+        finishing = bool(stopping) or (parent_pid is not None and os.getppid() != parent_pid)
+        batch = []
+        for ring in rings:
+            batch.extend(ring.drain())
+        if batch:
+            data = b"".join(batch)
+            _write_all(fd, data)
+            shipped["records"] += len(batch)
+            shipped["bytes"] += len(data)
+            shipped["batches"] += 1
+        if evaluator is not None:
+            # 评估失败只影响告警，不能中断日志转发
+            try:
+                if batch:
+                    _evaluate(evaluator, batch)
+                elif time.monotonic() >= next_tick:
+                    evaluator.tick()
+                    next_tick = time.monotonic() + ALERT_TICK_INTERVAL
+            except Exception:
+                traceback.print_exc()
+            if alert_lines:
+                _write_all(fd, b"".join(alert_lines))
+                del alert_lines[:]
+        if LOG_SHIPPER_METRICS_INTERVAL > 0 and time.monotonic() >= next_metrics:
+            _write_all(fd, _metrics_line(rings, shipped))
+            next_metrics = time.monotonic() + LOG_SHIPPER_METRICS_INTERVAL
+        if finishing and not batch:
+            if LOG_SHIPPER_METRICS_INTERVAL > 0:
+                _write_all(fd, _metrics_line(rings, shipped))
+            break
+        if not batch:
+            time.sleep(interval)
+
+    if fd != 1:
+        os.close(fd)
+
+
+def start_shipper(close_fds=()):
+    """
+    在 master 中 fork 转发进程（须在 fork worker 之前调用，worker 才能得知其进程号）
+
+    参数:
+        close_fds: 子进程中需要关闭的文件描述符（如监听套接字）
+
+    返回:
+        int: 转发进程号
+    """
+    if _shipper["shared_pid"] is None:
+        # 进程号放在共享内存中，worker 在 fork 时继承，转发进程重启后也能看到新的进程号
+        _shipper["shared_pid"] = mmap.mmap(-1, 8)
+    parent_pid = os.getpid()
+    pid = os.fork()
+    if pid:
+        _shipper["pid"] = pid
+        struct.pack_into("<q", _shipper["shared_pid"], 0, pid)
+        return pid
+
+    # 子进程：恢复默认信号处理（不继承 Gunicorn master 的处理器），
+    # Ctrl+C 由 master 统一处理，停止时 master 在 on_exit 中发送 SIGTERM
+    status = 0
+    try:
+        for sig in (signal.SIGHUP, signal.SIGQUIT, signal.SIGTTIN, signal.SIGTTOU,
+                    signal.SIGUSR1, signal.SIGUSR2, signal.SIGWINCH, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for fd in close_fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        run_shipper(_rings, LOG_SHIPPER_OUTPUT, parent_pid)
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def _shipper_exit_status(pid):
+    """
+    master 中检查转发进程是否已退出
+
+    返回:
+        str | None: 仍在运行时为 None，否则为退出状态描述
+    """
+    try:
+        done, status = os.waitpid(pid, os.WNOHANG)
+    except ChildProcessError:
+        # 已被 Gunicorn 的 reap_workers（waitpid(-1)）回收，退出码无从得知
+        return "reaped by master"
+    if not done:
+        return None
+    code = os.waitstatus_to_exitcode(status)
+    return f"killed by signal {-code}" if code < 0 else f"exit code {code}"
+
+
+def _watch_shipper(close_fds, log):
+    stopping = _shipper["stopping"]
+    while not stopping.wait(SHIPPER_CHECK_INTERVAL):
+        pid = _shipper["pid"]
+        status = _shipper_exit_status(pid)
+        if status is None or stopping.is_set():
+            continue
+        # 缓冲区与 tail 都在共享内存中，新的转发进程从上次转发的位置继续；告警窗口从零开始
+        log.error("Log shipper (pid: %s) exited (%s), restarting", pid, status)
+        try:
+            pid = start_shipper(close_fds())
+        except OSError as exc:
+            log.error("Failed to restart log shipper: %s", exc)
+            continue
+        log.info("Log shipper restarted (pid: %s)", pid)
+
+
+def supervise_shipper(close_fds, log):
+    """
+    在 master 中启动监控线程：每 SHIPPER_CHECK_INTERVAL 秒检查一次转发进程，
+    退出后通过 log 输出错误并重新启动（Gunicorn 的 reap_workers 会静默回收它）
+
+    参数:
+        close_fds: 返回重启时子进程中需要关闭的文件描述符的函数
+        log: 记录错误的日志对象（Gunicorn 的 server.log，输出到 stderr）
+    """
+    if _shipper["watchdog"] is not None:
+        return
+    watchdog = threading.Thread(target=_watch_shipper, args=(close_fds, log),
+                                name="log-shipper-watchdog", daemon=True)
+    _shipper["watchdog"] = watchdog
+    watchdog.start()
+
+
+def stop_shipper(timeout=10):
+    """master 退出前调用：停止监控线程，通知转发进程清空缓冲区后退出，并等待其结束"""
+    _shipper["stopping"].set()
+    watchdog = _shipper["watchdog"]
+    if watchdog is not None:
+        watchdog.join(timeout)
+    pid = _shipper["pid"]
+    if pid is None:
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if done:
+            return
+        time.sleep(0.05)
+
+
+# ============================================
+# 自检
+# ============================================
+
+def self_check():
+    """
+    在小容量缓冲区上验证读写往返（python log_ring.py --self-check）
+
+    覆盖: 记录跨越缓冲区末尾、缓冲区满时丢弃并计数、
+    第二个生产者（重启后的 worker）复用槽位并从共享的 head 继续写入
+
+    返回:
+        list[str]: 失败项，空列表表示全部通过
+    """
+    failures = []
+
+    def check(name, condition):
+        print(f"  {'✓' if condition else '✗'} {name}")
+        if not condition:
+            failures.append(name)
+
+    # 跨末尾回绕：容量不是记录长度的整数倍，多轮读写后记录必然跨越末尾
+    ring = LogRing(100)
+    sent, received, wrapped = [], [], 0
+    for i in range(200):
+        data = (f"line-{i}-" + "x" * (i % 37)).encode()
+        position = ring._producer["head"] if ring._producer else 0
+        if position % ring.capacity + RECORD_HEADER.size + len(data) > ring.capacity:
+            wrapped += 1
+        if ring.write(data):
+            sent.append(data)
+        received.extend(ring.drain())
+    check(f"回绕读写逐字节一致（{wrapped} 条记录跨越末尾）", wrapped > 0 and received == sent)
+
+    # 缓冲区满：不阻塞、丢弃并计数，消费者读完后恢复写入
+    ring = LogRing(64)
+    first = ring.write(b"a" * 40)
+    second = ring.write(b"b" * 40)
+    stats = ring.stats()
+    check("缓冲区满时丢弃并计数", first and not second and stats["dropped"] == 1
+          and stats["dropped_bytes"] == 40 and stats["written"] == 1)
+    check("读出已写入的记录后恢复写入", ring.drain() == [b"a" * 40] and ring.write(b"c" * 40)
+          and ring.drain() == [b"c" * 40])
+
+    # 第二个生产者复用槽位：新的 LogRing 对象共享同一块内存（相当于重启后的 worker）
+    successor = LogRing.__new__(LogRing)
+    successor.capacity, successor.buf = ring.capacity, ring.buf
+    successor._lock, successor._producer = threading.Lock(), None
+    successor._stalled = {"tail": None, "polls": 0}
+    records = [f"next-{i}".encode() for i in range(10)]
+    received = []
+    for data in records:
+        successor.write(data)
+        received.extend(ring.drain())
+    stats = ring.stats()
+    check("复用槽位后从共享 head 继续写入并保留计数",
+          received == records and stats["written"] == 12 and stats["dropped"] == 1)
+
+    # 发布了 head 但内容尚未可见（弱序 CPU）：不前移 tail，内容可见后正常读出
+    ring = LogRing(128)
+    ring.write(b"visible")
+    ring.buf[HEADER_SIZE + RECORD_HEADER.size] ^= 0xFF
+    check("校验失败时保留记录等待重试", ring.drain() == [] and ring.stats()["used_bytes"] > 0)
+    ring.buf[HEADER_SIZE + RECORD_HEADER.size] ^= 0xFF
+    check("内容可见后正常读出", ring.drain() == [b"visible"])
+    return failures
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["--self-check"]:
+        print("用法: python log_ring.py --self-check")
+        sys.exit(2)
+    print("环形缓冲区自检:")
+    sys.exit(1 if self_check() else 0)
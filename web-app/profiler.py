@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+请求级性能剖析 - 栈采样与火焰图数据输出
+
+功能:
+1. 后台线程按固定间隔采样正在处理请求的线程调用栈
+2. 请求结束时生成紧凑摘要（采样数、耗时最多的函数）
+3. 慢请求或抽样请求的完整采样写入本地目录（folded 格式），
+   可直接用 flamegraph.pl / speedscope 生成火焰图，目录按文件数滚动清理
+
+通过环境变量开启（默认关闭）:
+    PROFILING_ENABLED=true
+    PROFILE_SLOW_THRESHOLD_MS=1000   超过该耗时的请求保存采样
+    PROFILE_SAMPLE_RATE=0.01         额外随机保存的请求比例
+    PROFILE_INTERVAL_MS=5            采样间隔
+    PROFILE_DIR=/tmp/webapp-profiles
+    PROFILE_MAX_FILES=200
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# ============================================
+# 配置参数
+# ============================================
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# 慢请求阈值（毫秒），与 Logstash pipeline 中 slow_request 标签一致
+PROFILE_SLOW_THRESHOLD_MS = float(os.environ.get("PROFILE_SLOW_THRESHOLD_MS", "1000"))
+
+# 未超过阈值的请求按该比例随机保存
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+
+# 栈采样间隔（毫秒）
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+
+# 采样文件目录及保留文件数
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/webapp-profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+
+# 摘要中列出的函数数量
+SUMMARY_TOP_FRAMES = 5
+
+
+# ============================================
+# 栈采样
+# ============================================
+
+def _frame_name(code):
+    # 保留上一级目录，区分 flask/app.py 与应用自身的 app.py
+    location = "/".join(code.co_filename.replace(os.sep, "/").split("/")[-2:])
+    return f"{code.co_name} ({location}:{code.co_firstlineno})"
+
+
+class RequestProfile:
+    """单个请求的采样结果"""
+
+    def __init__(self):
+        self.stacks = Counter()     # 调用栈（根 -> 叶）-> 采样次数
+        self.samples = 0
+
+    def summary(self, interval_ms=PROFILE_INTERVAL_MS):
+        """
+        生成紧凑摘要
+
+        返回:
+            dict: samples / interval_ms / top_frames（按自身耗时，即叶子帧计数排序）
+        """
+        leaves = Counter()
+        for stack, n in self.stacks.items():
+            leaves[stack[-1]] += n
+        return {
+            "samples": self.samples,
+            "interval_ms": interval_ms,
+            "top_frames": [
+                {"frame": frame, "samples": n, "pct": round(n * 100.0 / self.samples, 1)}
+                for frame, n in leaves.most_common(SUMMARY_TOP_FRAMES)
+            ],
+        }
+
+    def folded(self):
+        """folded 格式（每行 "帧;帧;帧 次数"），供火焰图工具使用"""
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.stacks.items())
+
+
+class StackSampler:
+    """
+    栈采样器
+
+    后台线程每隔 interval 对已登记的线程调用 sys._current_frames() 取栈，
+    只采样正在处理请求的线程。线程在首次使用时启动，fork 后自动在子进程重建。
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.interval_ms = interval_ms
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._tracked = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def track(self, thread_id):
+        """开始采样指定线程，返回其 RequestProfile"""
+        self._ensure_started()
+        profile = RequestProfile()
+        with self._lock:
+            self._tracked[thread_id] = profile
+        return profile
+
+    def untrack(self, thread_id):
+        with self._lock:
+            return self._tracked.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # 取栈和更新计数都在锁内完成：untrack 返回后不会再有写入，
+            # 请求线程随后调用 summary()/folded() 遍历 stacks 是安全的
+            with self._lock:
+                if not self._tracked:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, profile in self._tracked.items():
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame.f_code))
+                        frame = frame.f_back
+                    stack.reverse()
+                    profile.stacks[tuple(stack)] += 1
+                    profile.samples += 1
+                del frames
+
+
+# ============================================
+# 采样文件输出
+# ============================================
+
+def should_keep(total_ms):
+    """是否保存本次请求的采样：超过慢请求阈值或命中随机抽样"""
+    if total_ms >= PROFILE_SLOW_THRESHOLD_MS:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def write_profile(profile, trace_id, directory=PROFILE_DIR, max_files=PROFILE_MAX_FILES):
+    """
+    写入 folded 格式采样文件，并删除超出保留数量的最旧文件
+
+    参数:
+        profile: RequestProfile
+        trace_id: 请求 trace_id，用于与日志关联
+
+    返回:
+        str: 文件路径
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}-{trace_id}.folded"
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profile.folded())
+
+    files = sorted(entry.name for entry in os.scandir(directory) if entry.name.endswith(".folded"))
+    for old in files[:max(0, len(files) - max_files)]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except OSError:
+            pass
+    return path
+
+
+# 进程内共享的采样器
+sampler = StackSampler()
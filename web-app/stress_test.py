@@ -9,8 +9,20 @@
 2. 模拟正常请求和异常请求
 3. 模拟真实业务场景（浏览、登录、下单）
 4. 产生多样化的日志数据
+5. 回放模式：读取采集到的 Gunicorn 访问日志或应用 JSON 日志，
+   按原始请求间隔（可按倍速缩放）重放真实流量
+
+用法示例:
+    python stress_test.py
+    python stress_test.py --replay web-app-json.log --speed 10
+    docker logs elk-web-app 2>&1 | python stress_test.py --replay - --format access
 """
 
+import argparse
+import gzip
+import heapq
+import json
+import re
 import requests
 import random
 import time
@@ -18,6 +30,7 @@ import threading
 import signal
 import sys
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 
@@ -54,15 +67,65 @@ USER_AGENTS = [
 # 是否显示详细日志
 VERBOSE = True
 
+# HTTP 连接池大小（不小于并发数，连接可复用而不会被丢弃重建）
+HTTP_POOL_SIZE = 64
+
+# 回放模式：同时在途的最大请求数
+REPLAY_MAX_INFLIGHT = 50
+
+# 回放模式：实际发出时间晚于计划超过该值（秒）计为滞后
+REPLAY_LAG_THRESHOLD = 0.1
+
+# 回放应用 JSON 日志时的重排窗口（秒）：日志按请求结束时间写出，
+# 还原的到达时间最多乱序一个最大响应时间（取 Gunicorn 默认超时 30 秒）
+REPLAY_REORDER_WINDOW = 30.0
+
+# 响应时间蓄水池大小：超过后按蓄水池抽样估算分位数，内存不随请求数增长
+RESPONSE_TIME_RESERVOIR_SIZE = 100000
+
 # ============================================
 # 全局统计变量
 # ============================================
+
+class ResponseTimeReservoir:
+    """
+    响应时间蓄水池
+
+    最小值/最大值/平均值精确统计，分位数基于最多 size 个均匀抽样
+    （请求数不超过 size 时即为全量），长时间压测或回放大文件时内存有上限。
+    """
+
+    def __init__(self, size=RESPONSE_TIME_RESERVOIR_SIZE):
+        self.size = size
+        self.samples = []
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self._random = random.Random()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            index = self._random.randrange(self.count)
+            if index < self.size:
+                self.samples[index] = value
+
+
 stats = {
     "total_requests": 0,
     "success_count": 0,
     "error_count": 0,
     "status_codes": defaultdict(int),
-    "response_times": [],
+    "response_times": ResponseTimeReservoir(),
     "start_time": None,
     "running": True
 }
@@ -149,6 +212,30 @@ SCENARIOS = [
 TOTAL_WEIGHT = sum(scenario["weight"] for scenario in SCENARIOS)
 
 
+# ============================================
+# HTTP 客户端
+# ============================================
+
+def create_session(pool_size=HTTP_POOL_SIZE):
+    """
+    创建带连接池的 HTTP 会话，所有线程共享，复用 keep-alive 连接
+
+    参数:
+        pool_size: 每个主机的最大连接数
+
+    返回:
+        requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+http_session = create_session()
+
+
 # ============================================
 # 辅助函数
 # ============================================
@@ -189,12 +276,13 @@ def get_url(scenario):
     return TARGET_URL + url
 
 
-def send_request(scenario):
+def send_request(scenario, user_agent=None):
     """
     发送 HTTP 请求
     
     参数:
         scenario: 场景配置
+        user_agent: 指定 User-Agent（回放时使用原始值），默认随机选择
     
     返回:
         dict: 包含响应信息的字典
@@ -202,20 +290,18 @@ def send_request(scenario):
     method = scenario["method"]
     url = get_url(scenario)
     headers = {
-        "User-Agent": random.choice(USER_AGENTS),
+        "User-Agent": user_agent or random.choice(USER_AGENTS),
         "Accept-Language": random.choice(["en-US,en;q=0.9", "zh-CN,zh;q=0.9", "en-GB,en;q=0.8"]),
     }
     
     try:
         start_time = time.time()
         
-        # 发送请求（设置超时为 10 秒）
-        if method == "GET":
-            response = requests.get(url, timeout=10, headers=headers)
-        elif method == "POST":
-            response = requests.post(url, json={}, timeout=10, headers=headers)
+        # 发送请求（设置超时为 10 秒），通过共享连接池复用连接
+        if method == "POST":
+            response = http_session.post(url, json={}, timeout=10, headers=headers)
         else:
-            response = requests.request(method, url, timeout=10, headers=headers)
+            response = http_session.request(method, url, timeout=10, headers=headers)
         
         response_time = time.time() - start_time
         
@@ -342,6 +428,200 @@ def simulate_user(user_id, duration):
     print(f"👤 User {user_id} finished - Total requests: {request_count}")
 
 
+# ============================================
+# 流量回放
+# ============================================
+
+# Gunicorn 访问日志（与 logstash docker-logs.conf 中的 grok 一致，可带 referrer/User-Agent）
+ACCESS_LOG_PATTERN = re.compile(
+    r'^\S+ \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<url>\S+) HTTP/[\d.]+" '
+    r'\d{3} \S+(?: "[^"]*" "(?P<agent>[^"]*)")?'
+)
+
+# 应用 JSON 日志中的 url 字段为完整地址，回放时只取路径和查询串
+URL_PATH_PATTERN = re.compile(r"^https?://[^/]+(?P<path>/.*)$")
+
+
+def _unwrap_docker(line):
+    """去掉 Docker json-file 封装，返回内层日志行"""
+    if line.startswith('{"log"'):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return line
+        if isinstance(record, dict) and "stream" in record:
+            return record.get("log", "")
+    return line
+
+
+def parse_capture_line(line):
+    """
+    解析一行采集到的日志为请求
+
+    参数:
+        line: 日志行（支持 Docker json-file 封装）
+
+    返回:
+        tuple | None: (类型 "access"/"app", 请求开始时间戳秒, 方法, 路径, User-Agent)
+    """
+    line = _unwrap_docker(line.strip()).strip()
+    if not line:
+        return None
+
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        method, url, timestamp = record.get("http_method"), record.get("url"), record.get("timestamp")
+        if not (method and url and timestamp):
+            return None
+        match = URL_PATH_PATTERN.match(url)
+        try:
+            ts = datetime.fromisoformat(timestamp.rstrip("Z")).timestamp()
+        except ValueError:
+            return None
+        # 应用日志在请求结束时写出，减去响应时间还原请求到达时刻
+        ts -= (record.get("response_time_ms") or 0) / 1000.0
+        return "app", ts, method, match.group("path") if match else url, record.get("user_agent")
+
+    match = ACCESS_LOG_PATTERN.match(line)
+    if not match:
+        return None
+    try:
+        ts = datetime.strptime(match.group("time"), "%d/%b/%Y:%H:%M:%S %z").timestamp()
+    except ValueError:
+        return None
+    agent = match.group("agent")
+    return "access", ts, match.group("method"), match.group("url"), agent if agent not in (None, "-") else None
+
+
+def _open_capture(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def iter_capture(path, log_format="auto", reorder_window=REPLAY_REORDER_WINDOW):
+    """
+    流式读取采集文件，逐条产出请求（不整体载入内存）
+
+    Gunicorn 访问日志时间只精确到秒，同一秒内的请求在该秒内均匀展开；
+    auto 模式下以第一条可识别的请求确定类型，忽略另一种日志（避免同一
+    容器日志中访问日志与应用日志重复回放）。
+
+    应用日志按请求结束时间写出，还原的到达时间不是文件顺序：请求先放入按到达时间
+    排序的堆，已读到的最大到达时间超过 堆顶 + reorder_window 时才产出堆顶
+    （之后的行到达时间不会早于 当前最大到达时间 - 最大响应时间），堆中最多保留
+    reorder_window 秒内的请求。
+
+    参数:
+        path: 文件路径，"-" 表示标准输入，.gz 自动解压
+        log_format: auto / access / app
+        reorder_window: 应用日志重排窗口（秒），不小于最大响应时间
+
+    返回:
+        generator: (时间戳秒, 方法, 路径, User-Agent)
+    """
+    same_second = []
+    pending = []  # 应用日志重排堆: (到达时间, 序号, 方法, 路径, User-Agent)
+    cursor = float("-inf")
+    sequence = 0
+
+    def flush():
+        for i, (ts, method, url, agent) in enumerate(same_second):
+            yield ts + i / len(same_second), method, url, agent
+        same_second.clear()
+
+    f = _open_capture(path)
+    try:
+        for line in f:
+            parsed = parse_capture_line(line)
+            if parsed is None:
+                continue
+            kind, ts, method, url, agent = parsed
+            if log_format == "auto":
+                log_format = kind
+            if kind != log_format:
+                continue
+            if kind == "app":
+                cursor = max(cursor, ts)
+                heapq.heappush(pending, (ts, sequence, method, url, agent))
+                sequence += 1
+                while pending[0][0] + reorder_window < cursor:
+                    ts, _, method, url, agent = heapq.heappop(pending)
+                    yield ts, method, url, agent
+                continue
+            if same_second and same_second[0][0] != ts:
+                yield from flush()
+            same_second.append((ts, method, url, agent))
+        yield from flush()
+        while pending:
+            ts, _, method, url, agent = heapq.heappop(pending)
+            yield ts, method, url, agent
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def replay(path, speed=1.0, max_inflight=REPLAY_MAX_INFLIGHT, log_format="auto",
+           reorder_window=REPLAY_REORDER_WINDOW):
+    """
+    按原始时间间隔回放采集的请求
+
+    第一条请求立即发出，之后每条请求在 (原始时间差 / speed) 时刻发出；
+    在途请求达到 max_inflight 时暂停读取，发出时间晚于计划的记为滞后。
+
+    参数:
+        path: 采集文件
+        speed: 回放倍速，0 表示不等待、尽快发送
+        max_inflight: 最大在途请求数
+        log_format: auto / access / app
+        reorder_window: 应用日志重排窗口（秒）
+
+    返回:
+        dict: replayed / lagged / max_lag 回放统计
+    """
+    slots = threading.BoundedSemaphore(max_inflight)
+    summary = {"replayed": 0, "lagged": 0, "max_lag": 0.0}
+
+    def run(scenario, agent):
+        try:
+            result = send_request(scenario, user_agent=agent)
+            update_stats(result)
+            print_result(result)
+        finally:
+            slots.release()
+
+    first_ts = wall_start = None
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        for ts, method, url, agent in iter_capture(path, log_format, reorder_window):
+            if not stats["running"]:
+                break
+            if first_ts is None:
+                first_ts, wall_start = ts, time.monotonic()
+
+            if speed > 0:
+                due = wall_start + max(0.0, ts - first_ts) / speed
+                # 分段等待，保证 Ctrl+C 能及时生效
+                while stats["running"] and time.monotonic() < due:
+                    time.sleep(min(due - time.monotonic(), 0.5))
+            slots.acquire()
+
+            if speed > 0:
+                lag = time.monotonic() - due
+                if lag > REPLAY_LAG_THRESHOLD:
+                    summary["lagged"] += 1
+                    summary["max_lag"] = max(summary["max_lag"], lag)
+
+            scenario = {"name": f"回放 {method}", "method": method, "url": url}
+            executor.submit(run, scenario, agent)
+            summary["replayed"] += 1
+    return summary
+
+
 # ============================================
 # 统计报告
 # ============================================
@@ -367,12 +647,13 @@ def print_stats():
         percentage = count / stats["total_requests"] * 100
         print(f"  {code}: {count} ({percentage:.1f}%)")
     
-    if stats["response_times"]:
-        response_times = sorted(stats["response_times"])
+    reservoir = stats["response_times"]
+    if reservoir:
+        response_times = sorted(reservoir.samples)
         print("\n响应时间统计:")
-        print(f"  最小值: {min(response_times)*1000:.2f} ms")
-        print(f"  最大值: {max(response_times)*1000:.2f} ms")
-        print(f"  平均值: {sum(response_times)/len(response_times)*1000:.2f} ms")
+        print(f"  最小值: {reservoir.min*1000:.2f} ms")
+        print(f"  最大值: {reservoir.max*1000:.2f} ms")
+        print(f"  平均值: {reservoir.total/reservoir.count*1000:.2f} ms")
         print(f"  P50: {response_times[len(response_times)//2]*1000:.2f} ms")
         print(f"  P95: {response_times[int(len(response_times)*0.95)]*1000:.2f} ms")
         print(f"  P99: {response_times[int(len(response_times)*0.99)]*1000:.2f} ms")
@@ -396,10 +677,34 @@ def signal_handler(sig, frame):
 # 主函数
 # ============================================
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ELK 日志压力测试 / 流量回放工具")
+    parser.add_argument("--target", default=TARGET_URL, help="目标服务器地址")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="回放采集的日志文件（Gunicorn 访问日志或应用 JSON 日志，- 表示标准输入）")
+    parser.add_argument("--format", choices=("auto", "access", "app"), default="auto",
+                        help="回放日志类型，auto 按第一条可识别的请求判断")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="回放倍速，2 表示两倍速，0 表示不等待")
+    parser.add_argument("--max-inflight", type=int, default=REPLAY_MAX_INFLIGHT,
+                        help="回放时最大在途请求数")
+    parser.add_argument("--reorder-window", type=float, default=REPLAY_REORDER_WINDOW,
+                        help="回放应用 JSON 日志时按到达时间重排的窗口（秒），不小于最大响应时间")
+    parser.add_argument("--quiet", action="store_true", help="不逐条打印请求结果")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """
     主函数 - 启动压力测试
     """
+    global TARGET_URL, VERBOSE, http_session
+    args = parse_args(argv)
+    TARGET_URL = args.target.rstrip("/")
+    VERBOSE = not args.quiet
+    if args.replay and args.max_inflight > HTTP_POOL_SIZE:
+        http_session = create_session(args.max_inflight)
+
     # 注册信号处理器
     signal.signal(signal.SIGINT, signal_handler)
     
@@ -407,15 +712,20 @@ def main():
     print("🚀 ELK 日志压力测试工具")
     print("=" * 70)
     print(f"目标地址: {TARGET_URL}")
-    print(f"并发用户: {CONCURRENT_USERS}")
-    print(f"持续时间: {DURATION if DURATION > 0 else '持续运行（按 Ctrl+C 停止）'} 秒")
-    print(f"请求间隔: {REQUEST_INTERVAL[0]}-{REQUEST_INTERVAL[1]} 秒")
+    if args.replay:
+        print(f"回放文件: {args.replay}（{args.format}）")
+        print(f"回放倍速: {args.speed if args.speed > 0 else '不等待'}")
+        print(f"最大在途: {args.max_inflight}")
+    else:
+        print(f"并发用户: {CONCURRENT_USERS}")
+        print(f"持续时间: {DURATION if DURATION > 0 else '持续运行（按 Ctrl+C 停止）'} 秒")
+        print(f"请求间隔: {REQUEST_INTERVAL[0]}-{REQUEST_INTERVAL[1]} 秒")
     print("=" * 70 + "\n")
     
     # 检查服务是否可用
     print("🔍 检查目标服务...")
     try:
-        response = requests.get(f"{TARGET_URL}/health", timeout=5)
+        response = http_session.get(f"{TARGET_URL}/health", timeout=5)
         if response.status_code == 200:
             print("✅ 目标服务正常\n")
         else:
@@ -427,6 +737,19 @@ def main():
     
     # 记录开始时间
     stats["start_time"] = time.time()
+
+    if args.replay:
+        print("⏯️  开始回放...\n")
+        summary = replay(args.replay, args.speed, args.max_inflight, args.format, args.reorder_window)
+        if not stats["total_requests"]:
+            print("⚠️  采集文件中没有可回放的请求")
+            return
+        print_stats()
+        print(f"回放请求: {summary['replayed']}，"
+              f"滞后超过 {REPLAY_LAG_THRESHOLD * 1000:.0f}ms: {summary['lagged']}，"
+              f"最大滞后: {summary['max_lag'] * 1000:.1f} ms")
+        print("✅ 回放完成！")
+        return
     
     # 启动线程池
     print(f"🏃 启动 {CONCURRENT_USERS} 个并发用户...\n")
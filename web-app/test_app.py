@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Web 应用测试
+
+用法:
+    python -m unittest test_app
+    python -m pytest test_app.py
+"""
+
+import logging
+import time
+import unittest
+from unittest import mock
+
+from werkzeug.exceptions import InternalServerError
+
+import app as webapp
+
+VIEW_SLEEP = 0.05
+ERROR_HANDLER_SLEEP = 0.03
+
+
+@webapp.app.route('/_test/unhandled')
+def _unhandled():
+    """耗时 50ms 后抛出未处理异常"""
+    time.sleep(VIEW_SLEEP)
+    raise RuntimeError("boom")
+
+
+def _slow_internal_error(error):
+    """耗时 30ms 的 500 错误处理器"""
+    time.sleep(ERROR_HANDLER_SLEEP)
+    return webapp.internal_error(error)
+
+
+class RequestTimingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = webapp.app.test_client()
+
+    def _request_record(self, path):
+        with self.assertLogs(webapp.logger, level=logging.INFO) as captured:
+            response = self.client.get(path)
+        records = [r for r in captured.records if getattr(r, "url", "").endswith(path)]
+        self.assertEqual(len(records), 1)
+        return response, records[0]
+
+    def test_unhandled_exception_counts_error_handler_time(self):
+        """未处理异常：500 错误处理器的耗时计入 handler_time_ms"""
+        handlers = webapp.app.error_handler_spec[None][500]
+        with mock.patch.dict(handlers, {InternalServerError: _slow_internal_error}):
+            response, record = self._request_record('/_test/unhandled')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(record.status_code, 500)
+        expected_ms = (VIEW_SLEEP + ERROR_HANDLER_SLEEP) * 1000
+        self.assertGreaterEqual(record.handler_time_ms, expected_ms)
+        self.assertLessEqual(record.handler_time_ms, record.response_time_ms)
+
+    def test_handled_http_error_counts_error_handler_time(self):
+        """404 错误处理器（handle_user_exception 路径）的耗时计入 handler_time_ms"""
+        response, record = self._request_record('/error/404')
+        self.assertEqual(response.status_code, 404)
+        self.assertGreater(record.handler_time_ms, 0)
+        self.assertLessEqual(record.handler_time_ms, record.response_time_ms)
+
+
+if __name__ == '__main__':
+    unittest.main()